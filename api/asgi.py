@@ -0,0 +1,755 @@
+import os
+import datetime
+import logging
+import contextlib
+from functools import wraps
+
+import jwt
+from dateutil import parser
+from sqlalchemy import select, func, event
+from sqlalchemy.orm import selectinload, Session as SyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Tikai modeļi un palīgfunkcijas: Flask dzinējs, žurnāla pavediens un iesildīšana šeit nav vajadzīgi
+os.environ['FLASK_STARTUP'] = '0'
+
+from api.index import (  # noqa: E402
+    SECRET_KEY,
+    Employee,
+    Shift,
+    Material,
+    Order,
+    OrderMaterial,
+    StockMovement,
+    record_stock_movement,
+    collect_stock_alerts,
+    collect_stock_movements,
+    take_due_stock_snapshots,
+    discard_stock_movements,
+    collect_cache_changes,
+    apply_cache_invalidation,
+    discard_cache_changes,
+    consumption_upserts,
+    CONSUMED_STATUSES,
+    update_search_index,
+)
+
+# Asinhronā API versija (ASGI): uvicorn api.asgi:app
+
+
+def async_database_url(url):
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    if url.startswith('postgresql://'):
+        return 'postgresql+asyncpg://' + url[len('postgresql://'):]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url[len('sqlite://'):]
+    return url
+
+
+database_url = async_database_url(os.getenv('ASYNC_DATABASE_URL') or os.getenv('DATABASE_URL'))
+engine_options = {
+    'pool_size': int(os.getenv('ASYNC_POOL_SIZE', 10)),
+    'max_overflow': int(os.getenv('ASYNC_MAX_OVERFLOW', 10)),
+    'pool_pre_ping': True,
+}
+if database_url.startswith('postgresql+asyncpg'):
+    # Supabase pooler (pgbouncer transaction režīmā) neatbalsta sagatavotos vaicājumus
+    engine_options['connect_args'] = {'statement_cache_size': int(os.getenv('ASYNC_STATEMENT_CACHE_SIZE', 0))}
+elif database_url.startswith('sqlite'):
+    engine_options = {}
+
+engine = create_async_engine(database_url, **engine_options)
+
+
+class AlertingSession(SyncSession):
+    pass
+
+
+# Tie paši mazo krājumu brīdinājumi un meklēšanas indekss kā WSGI versijā
+event.listen(AlertingSession, 'after_flush', collect_stock_alerts)
+event.listen(AlertingSession, 'after_flush', update_search_index)
+# Periodiskie krājumu momentuzņēmumi
+event.listen(AlertingSession, 'after_flush', collect_stock_movements)
+event.listen(AlertingSession, 'before_commit', take_due_stock_snapshots)
+event.listen(AlertingSession, 'after_rollback', discard_stock_movements)
+# Izziņu keša invalidācija pēc commit (starp procesiem tikai ar CACHE_BACKEND=redis)
+event.listen(AlertingSession, 'after_flush', collect_cache_changes)
+event.listen(AlertingSession, 'after_commit', apply_cache_invalidation)
+event.listen(AlertingSession, 'after_rollback', discard_cache_changes)
+
+Session = async_sessionmaker(engine, expire_on_commit=False, sync_session_class=AlertingSession)
+
+VERSION_CONFLICT = 'Materiāla "{}" dati ir mainījušies. Lūdzu, atsvaidziniet lapu un mēģiniet vēlreiz.'
+NOT_ENOUGH = 'Nepietiek materiāla "{}". Pieejams: {} {}'
+
+
+def material_dict(material):
+    return {
+        'id': material.id,
+        'nosaukums': material.nosaukums,
+        'noliktava': material.noliktava,
+        'vieta': material.vieta,
+        'vieniba': material.vieniba,
+        'daudzums': material.daudzums,
+        'reorder_level': material.reorder_level,
+        'version': material.version
+    }
+
+
+def order_dict(order):
+    materials = []
+    # Tāda pati materiālu secība kā WSGI versijā
+    for order_material in sorted(order.materials, key=lambda link: link.material_id):
+        material = order_material.material
+        if material:
+            materials.append({
+                **material_dict(material),
+                'quantity': order_material.quantity,
+                'material_version': order_material.material_version
+            })
+
+    return {
+        'id': order.id,
+        'nosaukums': order.nosaukums,
+        'daudzums': order.daudzums,
+        'employee_id': order.employee_id,
+        'status': order.status,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None,
+        'materials': materials
+    }
+
+
+async def acceptance_time(session, order_id):
+    # Atcelšana, dzēšana un labojumi tiek ieskaitīti pieņemšanas periodā
+    return (await session.execute(
+        select(func.max(StockMovement.created_at)).where(
+            StockMovement.order_id == order_id,
+            StockMovement.reason == 'order_accept'
+        )
+    )).scalar()
+
+
+async def record_consumption(session, lines, at=None):
+    for statement in consumption_upserts(engine.dialect.name, lines, at):
+        await session.execute(statement)
+
+
+async def load_order(session, order_id, lock=False):
+    query = select(Order).where(Order.id == order_id).options(
+        selectinload(Order.materials).selectinload(OrderMaterial.material)
+    )
+    if lock:
+        query = query.with_for_update()
+    return (await session.execute(query)).scalars().first()
+
+
+async def load_materials(session, material_ids):
+    if not material_ids:
+        return {}
+    result = await session.execute(
+        select(Material).where(Material.id.in_(material_ids)).order_by(Material.id).with_for_update()
+    )
+    return {material.id: material for material in result.scalars()}
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def token_required(f):
+    @wraps(f)
+    async def decorator(request):
+        token = request.headers.get('Authorization')
+        if not token or not token.startswith("Bearer "):
+            return JSONResponse({"error": "Token is missing or incorrect format!"}, 403)
+
+        token = token[7:]
+        try:
+            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        except jwt.ExpiredSignatureError:
+            return JSONResponse({"error": "Token expired"}, 401)
+        except jwt.InvalidTokenError:
+            return JSONResponse({"error": "Invalid token"}, 403)
+
+        async with Session() as session:
+            user = await session.get(Employee, decoded['user_id'])
+            if not user:
+                return JSONResponse({"error": "User not found"}, 404)
+            return await f(request, session, user)
+    return decorator
+
+
+@token_required
+async def get_materials(request, session, current_user):
+    try:
+        materials = (await session.execute(select(Material))).scalars().all()
+        return JSONResponse([material_dict(material) for material in materials])
+    except Exception as e:
+        logging.error(f"Error getting materials: {str(e)}")
+        return JSONResponse({"error": "Neizdevās iegūt materiālus", "details": str(e)}, 500)
+
+
+@token_required
+async def get_material(request, session, current_user):
+    try:
+        material = await session.get(Material, request.path_params['material_id'])
+        if not material:
+            return JSONResponse({"error": "Materiāls nav atrasts"}, 404)
+        return JSONResponse(material_dict(material))
+    except Exception as e:
+        logging.error(f"Error getting material: {str(e)}")
+        return JSONResponse({"error": "Neizdevās iegūt materiālu", "details": str(e)}, 500)
+
+
+@token_required
+async def get_orders(request, session, current_user):
+    try:
+        orders = (await session.execute(
+            select(Order).options(selectinload(Order.materials).selectinload(OrderMaterial.material)).order_by(Order.id)
+        )).scalars().all()
+        return JSONResponse([order_dict(order) for order in orders])
+    except Exception as e:
+        logging.error(f"Error getting orders: {str(e)}")
+        return JSONResponse({"error": "Neizdevās iegūt pasūtījumus", "details": str(e)}, 500)
+
+
+@token_required
+async def get_order(request, session, current_user):
+    try:
+        order = await load_order(session, request.path_params['order_id'])
+        if not order:
+            return JSONResponse({'error': 'Pasūtījums nav atrasts'}, 404)
+        return JSONResponse(order_dict(order))
+    except Exception as e:
+        logging.error(f"Error getting order: {str(e)}")
+        return JSONResponse({"error": "Neizdevās iegūt pasūtījumu", "details": str(e)}, 500)
+
+
+@token_required
+async def get_employees(request, session, current_user):
+    try:
+        employees = (await session.execute(select(Employee))).scalars().all()
+        return JSONResponse({"success": True, "employees": [employee.serialize() for employee in employees]})
+    except Exception as e:
+        logging.error(f"Error fetching employees: {str(e)}")
+        return JSONResponse({"error": "Failed to fetch employees", "details": str(e)}, 500)
+
+
+@token_required
+async def get_material_stats(request, session, current_user):
+    try:
+        results = (await session.execute(
+            select(
+                Material.id,
+                Material.nosaukums,
+                func.sum(func.coalesce(OrderMaterial.quantity, OrderMaterial.daudzums * Order.daudzums)).label("total")
+            ).join(OrderMaterial, Material.id == OrderMaterial.material_id)
+             .join(Order, Order.id == OrderMaterial.order_id)
+             .group_by(Material.id, Material.nosaukums)
+        )).all()
+
+        return JSONResponse([
+            {
+                "id": material_id,
+                "nosaukums": nosaukums,
+                "totalUsed": float(total) if total is not None else 0
+            }
+            for material_id, nosaukums, total in results
+        ])
+    except Exception as e:
+        logging.error(f"Stats error: {str(e)}")
+        return JSONResponse({"error": "Neizdevās iegūt statistiku"}, 500)
+
+
+@token_required
+async def get_shifts_stats(request, session, current_user):
+    try:
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+
+        query = select(Employee, Shift).join(Shift, Shift.employee_id == Employee.id).where(
+            Shift.start_time.is_not(None),
+            Shift.end_time.is_not(None)
+        )
+        if start:
+            query = query.where(Shift.start_time >= parser.parse(start))
+        if end:
+            query = query.where(Shift.end_time <= parser.parse(end))
+
+        stats = []
+        for emp, shift in (await session.execute(query.order_by(Employee.id, Shift.id))).all():
+            duration_hours = (shift.end_time - shift.start_time).total_seconds() / 3600
+            stats.append({
+                "id": emp.id,
+                "vards": emp.vards,
+                "uzvards": emp.uzvards,
+                "amats": emp.amats,
+                "hours": round(duration_hours, 2),
+                "start_time": shift.start_time.isoformat(),
+                "end_time": shift.end_time.isoformat()
+            })
+
+        return JSONResponse(stats, headers={'Access-Control-Allow-Origin': 'https://kv-darbs.vercel.app'})
+    except Exception as e:
+        logging.error(f"Stats error: {str(e)}")
+        return JSONResponse({"error": "Stats generation failed"}, 500)
+
+
+@token_required
+async def create_material(request, session, current_user):
+    try:
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({'error': 'Nav datu'}, 400)
+
+        for field in ['nosaukums', 'noliktava', 'vieta', 'vieniba', 'daudzums']:
+            if field not in data:
+                return JSONResponse({'error': f'Trūkst lauka: {field}'}, 400)
+
+        if float(data['daudzums']) < 0.01:
+            return JSONResponse({'error': 'Daudzumam jābūt vismaz 0.01'}, 400)
+
+        material = Material(
+            nosaukums=data['nosaukums'],
+            noliktava=data['noliktava'],
+            vieta=data['vieta'],
+            vieniba=data['vieniba'],
+            daudzums=float(data['daudzums']),
+            version=1
+        )
+        session.add(material)
+        await session.flush()
+        record_stock_movement(material.id, material.daudzums, 'create', current_user, session=session)
+        await session.commit()
+
+        return JSONResponse({
+            "success": True,
+            "message": "Materiāls izveidots",
+            "material": material_dict(material)
+        }, 201)
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error creating material: {str(e)}")
+        return JSONResponse({"error": "Neizdevās izveidot materiālu", "details": str(e)}, 500)
+
+
+@token_required
+async def update_material(request, session, current_user):
+    try:
+        data = await read_json(request) or {}
+        materials = await load_materials(session, [request.path_params['material_id']])
+        material = materials.get(request.path_params['material_id'])
+        if not material:
+            return JSONResponse({"error": "Materiāls nav atrasts"}, 404)
+
+        if 'version' in data and material.version != data['version']:
+            return JSONResponse({"error": VERSION_CONFLICT.format(material.nosaukums)}, 409)
+
+        old_daudzums = material.daudzums
+        for key, value in data.items():
+            if key != 'version' and hasattr(material, key):
+                setattr(material, key, value)
+        if material.daudzums != old_daudzums:
+            record_stock_movement(material.id, float(material.daudzums or 0) - float(old_daudzums or 0), 'adjust', current_user, session=session)
+        material.version += 1
+
+        await session.commit()
+        return JSONResponse({
+            "success": True,
+            "message": "Materiāls atjaunināts",
+            "version": material.version
+        })
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error updating material: {str(e)}")
+        return JSONResponse({"error": "Neizdevās atjaunināt materiālu", "details": str(e)}, 500)
+
+
+@token_required
+async def delete_material(request, session, current_user):
+    try:
+        material = await session.get(Material, request.path_params['material_id'])
+        if not material:
+            return JSONResponse({"error": "Materiāls nav atrasts"}, 404)
+        record_stock_movement(material.id, -(material.daudzums or 0), 'delete', current_user, session=session)
+        await session.delete(material)
+        await session.commit()
+        return JSONResponse({"success": True, "message": "Materiāls izdzēsts"})
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error deleting material: {str(e)}")
+        return JSONResponse({"error": "Failed to delete material", "details": str(e)}, 500)
+
+
+@token_required
+async def move_material(request, session, current_user):
+    try:
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({'error': 'Nav datu'}, 400)
+
+        for field in ['noliktava', 'vieta', 'version']:
+            if field not in data:
+                return JSONResponse({'error': f'Trūkst lauka: {field}'}, 400)
+
+        materials = await load_materials(session, [request.path_params['material_id']])
+        material = materials.get(request.path_params['material_id'])
+        if not material:
+            return JSONResponse({'error': 'Materiāls nav atrasts'}, 404)
+
+        if material.version != data['version']:
+            return JSONResponse({'error': VERSION_CONFLICT.format(material.nosaukums)}, 409)
+
+        material.noliktava = data['noliktava']
+        material.vieta = data['vieta']
+        material.version += 1
+        await session.commit()
+
+        return JSONResponse({
+            "success": True,
+            "message": "Materiāls pārvietots",
+            "material": material_dict(material)
+        })
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error moving material: {str(e)}")
+        return JSONResponse({"error": "Neizdevās pārvietot materiālu", "details": str(e)}, 500)
+
+
+@token_required
+async def update_material_quantity(request, session, current_user):
+    try:
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({'error': 'Nav datu'}, 400)
+
+        for field in ['daudzums', 'version']:
+            if field not in data:
+                return JSONResponse({'error': f'Trūkst lauka: {field}'}, 400)
+
+        materials = await load_materials(session, [request.path_params['material_id']])
+        material = materials.get(request.path_params['material_id'])
+        if not material:
+            return JSONResponse({'error': 'Materiāls nav atrasts'}, 404)
+
+        if material.version != data['version']:
+            return JSONResponse({'error': VERSION_CONFLICT.format(material.nosaukums)}, 409)
+
+        if float(data['daudzums']) < 0.01:
+            return JSONResponse({'error': 'Daudzumam jābūt vismaz 0.01'}, 400)
+
+        record_stock_movement(material.id, float(data['daudzums']) - (material.daudzums or 0), 'adjust', current_user, session=session)
+        material.daudzums = float(data['daudzums'])
+        material.version += 1
+        await session.commit()
+
+        return JSONResponse({
+            "success": True,
+            "message": "Materiāla daudzums atjaunināts",
+            "material": material_dict(material)
+        })
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error updating material quantity: {str(e)}")
+        return JSONResponse({"error": "Neizdevās atjaunināt materiāla daudzumu", "details": str(e)}, 500)
+
+
+async def check_requested_materials(session, requested):
+    materials = await load_materials(session, [item['id'] for item in requested])
+    checked = []
+    for item in requested:
+        material = materials.get(item['id'])
+        if not material:
+            return None, JSONResponse({'error': f'Materiāls ar ID {item["id"]} nav atrasts'}, 404)
+        if material.version != item.get('version'):
+            return None, JSONResponse({'error': VERSION_CONFLICT.format(material.nosaukums)}, 409)
+        if material.daudzums < item['quantity']:
+            return None, JSONResponse({'error': NOT_ENOUGH.format(material.nosaukums, material.daudzums, material.vieniba)}, 400)
+        checked.append((material, item['quantity']))
+    return checked, None
+
+
+@token_required
+async def create_order(request, session, current_user):
+    try:
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({'error': 'Nav datu'}, 400)
+
+        for field in ['nosaukums', 'daudzums', 'employee_id', 'materials']:
+            if field not in data:
+                return JSONResponse({'error': f'Trūkst lauka: {field}'}, 400)
+
+        checked, error = await check_requested_materials(session, data['materials'])
+        if error:
+            return error
+
+        order = Order(
+            nosaukums=data['nosaukums'],
+            daudzums=float(data['daudzums']),
+            employee_id=data['employee_id'],
+            status='pending'
+        )
+        session.add(order)
+        await session.flush()
+
+        for material, quantity in checked:
+            material.daudzums -= quantity
+            material.version += 1
+            # Saitē glabājam versiju pēc rezervēšanas, pret to pārbauda apstiprināšana
+            session.add(OrderMaterial(
+                order_id=order.id,
+                material_id=material.id,
+                quantity=quantity,
+                material_version=material.version
+            ))
+            record_stock_movement(material.id, -quantity, 'order_create', current_user, order.id, session=session)
+
+        await session.commit()
+        return JSONResponse({
+            "success": True,
+            "message": "Pasūtījums izveidots",
+            "order_id": order.id
+        }, 201)
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error creating order: {str(e)}")
+        return JSONResponse({"error": "Neizdevās izveidot pasūtījumu", "details": str(e)}, 500)
+
+
+@token_required
+async def update_order(request, session, current_user):
+    try:
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({'error': 'Nav datu'}, 400)
+
+        order = await load_order(session, request.path_params['order_id'], lock=True)
+        if not order:
+            return JSONResponse({'error': 'Pasūtījums nav atrasts'}, 404)
+
+        if 'materials' in data:
+            checked, error = await check_requested_materials(session, data['materials'])
+            if error:
+                return error
+
+            # Vispirms atgriežam vecos daudzumus
+            consumption = []
+            old_links = list(order.materials)
+            old_materials = await load_materials(session, [link.material_id for link in old_links])
+            for link in old_links:
+                material = old_materials[link.material_id]
+                material.daudzums += link.quantity
+                material.version += 1
+                record_stock_movement(material.id, link.quantity, 'order_update', current_user, order.id, session=session)
+                consumption.append((material.id, material.noliktava, -link.quantity))
+                order.materials.remove(link)
+            await session.flush()
+
+            for material, quantity in checked:
+                material.daudzums -= quantity
+                material.version += 1
+                order.materials.append(OrderMaterial(
+                    material_id=material.id,
+                    quantity=quantity,
+                    material_version=material.version
+                ))
+                record_stock_movement(material.id, -quantity, 'order_update', current_user, order.id, session=session)
+                consumption.append((material.id, material.noliktava, quantity))
+
+            # Pieņemtam pasūtījumam izmaiņas ieskaitām pieņemšanas periodā
+            if order.status in CONSUMED_STATUSES:
+                await record_consumption(session, consumption, await acceptance_time(session, order.id))
+
+        if 'nosaukums' in data:
+            order.nosaukums = data['nosaukums']
+        if 'daudzums' in data:
+            order.daudzums = float(data['daudzums'])
+        if 'status' in data:
+            order.status = data['status']
+        if 'employee_id' in data:
+            order.employee_id = data['employee_id']
+
+        await session.commit()
+        return JSONResponse({
+            "success": True,
+            "message": "Pasūtījums atjaunināts",
+            "order_id": order.id
+        })
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error updating order: {str(e)}")
+        return JSONResponse({"error": "Neizdevās atjaunināt pasūtījumu", "details": str(e)}, 500)
+
+
+@token_required
+async def delete_order(request, session, current_user):
+    try:
+        order = await load_order(session, request.path_params['order_id'], lock=True)
+        if not order:
+            return JSONResponse({'error': 'Pasūtījums nav atrasts'}, 404)
+
+        consumption = []
+        materials = await load_materials(session, [link.material_id for link in order.materials])
+        for link in order.materials:
+            material = materials.get(link.material_id)
+            if material:
+                material.daudzums += link.quantity
+                material.version += 1
+                record_stock_movement(material.id, link.quantity, 'order_delete', current_user, order.id, session=session)
+                consumption.append((material.id, material.noliktava, -link.quantity))
+        if order.status in CONSUMED_STATUSES:
+            await record_consumption(session, consumption, await acceptance_time(session, order.id))
+
+        await session.delete(order)
+        await session.commit()
+        return JSONResponse({"success": True, "message": "Pasūtījums dzēsts"})
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error deleting order: {str(e)}")
+        return JSONResponse({"error": "Neizdevās dzēst pasūtījumu", "details": str(e)}, 500)
+
+
+async def transition_order(request, session, current_user, allowed, status_error, new_status, stock_sign, reason):
+    order = await load_order(session, request.path_params['order_id'], lock=True)
+    if not order:
+        return JSONResponse({'error': 'Pasūtījums nav atrasts'}, 404)
+
+    if not allowed(order.status):
+        return JSONResponse({'error': status_error}, 400)
+
+    materials = await load_materials(session, [link.material_id for link in order.materials])
+    for link in order.materials:
+        material = materials.get(link.material_id)
+        if not material:
+            return JSONResponse({'error': f'Materiāls ar ID {link.material_id} nav atrasts'}, 404)
+        if material.version != link.material_version:
+            return JSONResponse({'error': VERSION_CONFLICT.format(material.nosaukums)}, 409)
+        if stock_sign < 0 and material.daudzums < link.quantity:
+            return JSONResponse({'error': NOT_ENOUGH.format(material.nosaukums, material.daudzums, material.vieniba)}, 400)
+
+    if stock_sign:
+        consumption = []
+        for link in order.materials:
+            material = materials[link.material_id]
+            material.daudzums += stock_sign * link.quantity
+            material.version += 1
+            link.material_version = material.version
+            record_stock_movement(material.id, stock_sign * link.quantity, reason, current_user, order.id, session=session)
+            consumption.append((material.id, material.noliktava, -stock_sign * link.quantity))
+        # Patēriņa kopsavilkumā ir tikai pieņemtie pasūtījumi
+        if new_status == 'accepted':
+            await record_consumption(session, consumption)
+        elif order.status == 'accepted':
+            await record_consumption(session, consumption, await acceptance_time(session, order.id))
+
+    order.status = new_status
+    await session.commit()
+    return None
+
+
+@token_required
+async def accept_order(request, session, current_user):
+    try:
+        error = await transition_order(
+            request, session, current_user, lambda status: status == 'pending', 'Pasūtījums jau ir apstrādāts',
+            'accepted', -1, 'order_accept'
+        )
+        return error or JSONResponse({
+            "success": True,
+            "message": "Pasūtījums pieņemts",
+            "order_id": request.path_params['order_id']
+        })
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error accepting order: {str(e)}")
+        return JSONResponse({"error": "Neizdevās pieņemt pasūtījumu", "details": str(e)}, 500)
+
+
+@token_required
+async def finish_order(request, session, current_user):
+    try:
+        error = await transition_order(
+            request, session, current_user, lambda status: status == 'accepted', 'Pasūtījums nav pieņemts',
+            'finished', 0, None
+        )
+        return error or JSONResponse({
+            "success": True,
+            "message": "Pasūtījums pabeigts",
+            "order_id": request.path_params['order_id']
+        })
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error finishing order: {str(e)}")
+        return JSONResponse({"error": "Neizdevās pabeigt pasūtījumu", "details": str(e)}, 500)
+
+
+@token_required
+async def cancel_order(request, session, current_user):
+    try:
+        error = await transition_order(
+            request, session, current_user, lambda status: status != 'finished', 'Pabeigtu pasūtījumu nevar atcelt',
+            'cancelled', 1, 'order_cancel'
+        )
+        return error or JSONResponse({
+            "success": True,
+            "message": "Pasūtījums atcelts",
+            "order_id": request.path_params['order_id']
+        })
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"Error cancelling order: {str(e)}")
+        return JSONResponse({"error": "Neizdevās atcelt pasūtījumu", "details": str(e)}, 500)
+
+
+routes = [
+    Route('/materials', get_materials, methods=['GET']),
+    Route('/materials', create_material, methods=['POST']),
+    Route('/materials/{material_id:int}', get_material, methods=['GET']),
+    Route('/materials/{material_id:int}', update_material, methods=['PUT']),
+    Route('/materials/{material_id:int}', delete_material, methods=['DELETE']),
+    Route('/materials/{material_id:int}/move', move_material, methods=['PATCH']),
+    Route('/materials/{material_id:int}/quantity', update_material_quantity, methods=['PATCH']),
+    Route('/orders', get_orders, methods=['GET']),
+    Route('/orders', create_order, methods=['POST']),
+    Route('/orders/{order_id:int}', get_order, methods=['GET']),
+    Route('/orders/{order_id:int}', update_order, methods=['PUT']),
+    Route('/orders/{order_id:int}', delete_order, methods=['DELETE']),
+    Route('/orders/{order_id:int}/accept', accept_order, methods=['PATCH']),
+    Route('/orders/{order_id:int}/finish', finish_order, methods=['PATCH']),
+    Route('/orders/{order_id:int}/cancel', cancel_order, methods=['PATCH']),
+    Route('/employees', get_employees, methods=['GET']),
+    Route('/api/stats/materials', get_material_stats, methods=['GET']),
+    Route('/api/shifts/stats', get_shifts_stats, methods=['GET']),
+]
+
+middleware = [
+    Middleware(
+        CORSMiddleware,
+        allow_origins=['*'],
+        allow_credentials=True,
+        allow_headers=['Content-Type', 'Authorization'],
+        allow_methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'PATCH'],
+    ),
+    Middleware(GZipMiddleware, minimum_size=int(os.getenv('COMPRESS_MIN_SIZE', 1024))),
+]
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
@@ -1,15 +1,29 @@
 import os
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, jsonify, request, send_file, g, has_request_context, make_response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm import configure_mappers
 import jwt
 from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import datetime
 from functools import wraps
 import bcrypt
 import logging
+import logging.handlers
+import queue
+import atexit
+import contextlib
+import random
+import uuid
+import base64
+import cProfile
+import pstats
 from dotenv import load_dotenv
 from dateutil import parser
 import io
@@ -20,10 +34,45 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import Frame, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.units import cm
 from io import BytesIO
 from werkzeug.security import generate_password_hash
+from werkzeug.datastructures import MultiDict
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.test import EnvironBuilder
+import zlib
+import time
+import json
+import math
+import threading
+import signal
+import sqlite3
+import re
+import itertools
+import zipfile
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlencode
+import numpy as np
+from zoneinfo import ZoneInfo
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import redis
+except ImportError:
+    redis = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 load_dotenv()
 
 app = Flask(__name__)
@@ -42,15 +91,223 @@ CORS(app, resources={r"/*": {
     
 }})
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+# api.asgi importē šo moduli tikai modeļu un palīgfunkciju dēļ (FLASK_STARTUP=0): tad nesākam
+# Flask datubāzes dzinēju, žurnāla pavedienu un iesildīšanu
+app.config['FLASK_STARTUP'] = os.getenv('FLASK_STARTUP', '1') == '1'
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+
+# Lasīšanas replika (nav obligāta)
+app.config['REPLICA_DATABASE_URL'] = os.getenv('REPLICA_DATABASE_URL')
+app.config['REPLICA_MAX_LAG'] = float(os.getenv('REPLICA_MAX_LAG', 5))
+app.config['REPLICA_LAG_CHECK_INTERVAL'] = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 2))
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 10))
+if app.config['REPLICA_DATABASE_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': app.config['REPLICA_DATABASE_URL']}
+
+
+class RoutingSession(FlaskSession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # Replikai sūtam tikai lasīšanu no read_replica maršrutiem, nekad flush vai DML
+        if (
+            bind is None
+            and has_request_context()
+            and g.get('use_replica')
+            and not self._flushing
+            and not getattr(clause, 'is_dml', False)
+        ):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+if app.config['FLASK_STARTUP']:
+    db.init_app(app)
 
 
 SECRET_KEY = "your_secret_key"
 
 
-logging.basicConfig(level=logging.DEBUG)
+# Žurnalēšana: ieraksti tiek nodoti rindā un izvadīti fona pavedienā, lai pieprasījums negaida uz izvadi
+app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Atsevišķu žurnālu līmeņi, piem. "sqlalchemy.engine=INFO,werkzeug=WARNING"
+app.config['LOG_LEVELS'] = os.getenv('LOG_LEVELS', 'sqlalchemy=WARNING,werkzeug=WARNING,urllib3=WARNING')
+app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'json')
+# Daļa pieprasījumu, kuriem izvada ierakstus zem WARNING līmeņa (izlase pēc pieprasījuma, ne pēc ieraksta)
+app.config['LOG_SAMPLE_RATE'] = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+app.config['LOG_ACCESS'] = os.getenv('LOG_ACCESS', '1') == '1'
+
+REQUEST_ID_PATTERN = re.compile(r'^[\w.\-]{1,64}$')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key in ('http', 'sql'):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        if not has_request_context():
+            record.request_id = None
+            return True
+        record.request_id = g.get('request_id')
+        return record.levelno >= logging.WARNING or g.get('log_sampled', True)
+
+
+def configure_logging():
+    if app.config['LOG_FORMAT'] == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+    output = logging.StreamHandler()
+    output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(app.config['LOG_LEVEL'])
+    for item in app.config['LOG_LEVELS'].split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    def restart_listener():
+        # Pēc fork (piem. gunicorn --preload) fona pavediens bērnprocesā vairs nedarbojas
+        listener._thread = None
+        listener.start()
+    os.register_at_fork(after_in_child=restart_listener)
+    return listener
+
+
+log_listener = configure_logging() if app.config['FLASK_STARTUP'] else None
+
+
+@app.before_request
+def start_request_log():
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+    g.log_sampled = random.random() < app.config['LOG_SAMPLE_RATE']
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def finish_request_log(response):
+    request_id = g.get('request_id')
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    if app.config['LOG_ACCESS'] and 'request_started' in g:
+        logging.getLogger('api.access').info('%s %s %s', request.method, request.path, response.status_code, extra={'http': {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 2)
+        }})
+    return response
+
+
+# Atbilžu saspiešana (gzip/brotli)
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', 6))
+app.config['COMPRESS_BROTLI_LEVEL'] = int(os.getenv('COMPRESS_BROTLI_LEVEL', 4))
+app.config['COMPRESS_MIMETYPES'] = {
+    'application/json',
+    'text/html',
+    'text/plain',
+    'text/csv',
+    'application/javascript',
+}
+
+
+def choose_encoding(accept_encoding):
+    accepted = {}
+    for part in accept_encoding.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    # Brotli dod labāku saspiešanu, ja klients to atbalsta un modulis ir pieejams
+    candidates = ['br', 'gzip'] if brotli else ['gzip']
+    best = None
+    best_q = 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def make_compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=app.config['COMPRESS_BROTLI_LEVEL'])
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(app.config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_stream(chunks, encoding):
+    compress, finish = make_compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+@app.after_request
+def compress_response(response):
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code == 204:
+        return response
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    # PDF, ZIP un citi jau saspiesti formāti netiek saspiesti atkārtoti
+    if response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+        return response
+
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if not encoding:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        compress, finish = make_compressor(encoding)
+        response.set_data(compress(data) + finish())
+
+    response.headers['Content-Encoding'] = encoding
+    return response
 
 
 
@@ -97,6 +354,17 @@ class Material(db.Model):
     vieniba = db.Column(db.String(20))
     daudzums = db.Column(db.Float)
     version = db.Column(db.Integer, default=1)
+    # Pasūtīšanas slieksnis; zem tā materiāls ir mazo krājumu sarakstā
+    reorder_level = db.Column(db.Float, nullable=True)
+
+    # Daļējais indekss satur tikai mazo krājumu rindas, tādēļ saraksts nav jāmeklē pa visu tabulu
+    __table_args__ = (
+        db.Index(
+            'ix_materials_low_stock', 'id',
+            postgresql_where=db.text('daudzums < reorder_level'),
+            sqlite_where=db.text('daudzums < reorder_level')
+        ),
+    )
 
     order_links = db.relationship(
     "OrderMaterial",
@@ -114,6 +382,8 @@ class Order(db.Model):
     daudzums = db.Column(db.Float)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=True)
     status = db.Column(db.String(20), default="Nav sākts")      
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
    
     materials = db.relationship("OrderMaterial", backref="order",  cascade="all, delete-orphan")
 
@@ -136,6 +406,300 @@ class OrderMaterial(db.Model):
 )
 
     daudzums = db.Column(db.Float)
+    # Kopējais materiāla daudzums pasūtījumam un materiāla versija pasūtījuma veidošanas brīdī
+    quantity = db.Column(db.Float)
+    material_version = db.Column(db.Integer)
+
+
+class ConsumptionHourly(db.Model):
+    __tablename__ = 'consumption_hourly'
+    material_id = db.Column(db.Integer, primary_key=True)
+    noliktava = db.Column(db.String(20), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    quantity = db.Column(db.Float, nullable=False, default=0)
+    lines = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ConsumptionDaily(db.Model):
+    __tablename__ = 'consumption_daily'
+    material_id = db.Column(db.Integer, primary_key=True)
+    noliktava = db.Column(db.String(20), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    quantity = db.Column(db.Float, nullable=False, default=0)
+    lines = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StockMovement(db.Model):
+    __tablename__ = 'stock_movements'
+    id = db.Column(db.Integer, primary_key=True)
+    # Bez ārējās atslēgas, lai ieraksti paliek arī pēc materiāla dzēšanas
+    material_id = db.Column(db.Integer, nullable=False, index=True)
+    delta = db.Column(db.Float, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)
+    order_id = db.Column(db.Integer, nullable=True, index=True)
+    employee_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.utcnow, index=True)
+
+
+class StockSnapshot(db.Model):
+    __tablename__ = 'stock_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    material_id = db.Column(db.Integer, nullable=False, index=True)
+    daudzums = db.Column(db.Float)
+    # Pēdējā kustība, kas jau ir iekļauta momentuzņēmumā
+    movement_id = db.Column(db.Integer, nullable=False, default=0)
+    taken_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.utcnow, index=True)
+
+
+class MaterialForecast(db.Model):
+    __tablename__ = 'material_forecasts'
+    material_id = db.Column(db.Integer, primary_key=True)
+    daily_rate = db.Column(db.Float)
+    moving_avg_short = db.Column(db.Float)
+    moving_avg_long = db.Column(db.Float)
+    variance = db.Column(db.Float)
+    safety_stock = db.Column(db.Float)
+    reorder_point = db.Column(db.Float)
+    days_of_cover = db.Column(db.Float)
+    history_days = db.Column(db.Integer)
+    computed_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.utcnow)
+
+
+class StockAlert(db.Model):
+    __tablename__ = 'stock_alerts'
+    id = db.Column(db.Integer, primary_key=True)
+    material_id = db.Column(db.Integer, nullable=False, index=True)
+    # 'low' - krājumi nokrita zem sliekšņa, 'restored' - atgriezās virs tā
+    kind = db.Column(db.String(10), nullable=False)
+    daudzums = db.Column(db.Float)
+    reorder_level = db.Column(db.Float)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.datetime.utcnow)
+
+
+@db.event.listens_for(StockMovement, 'before_update')
+@db.event.listens_for(StockMovement, 'before_delete')
+def stock_movement_immutable(mapper, connection, target):
+    raise ValueError("Krājumu kustības žurnālu nedrīkst mainīt")
+
+
+def record_stock_movement(material_id, delta, reason, current_user=None, order_id=None, session=None):
+    if not delta:
+        return None
+    session = session or db.session
+    movement = StockMovement(
+        material_id=material_id,
+        delta=delta,
+        reason=reason,
+        order_id=order_id,
+        employee_id=current_user.id if current_user else None
+    )
+    session.add(movement)
+    return movement
+
+
+# Mazo krājumu brīdinājumi
+app.config['STOCK_ALERT_POLL_INTERVAL'] = float(os.getenv('STOCK_ALERT_POLL_INTERVAL', 2))
+app.config['STOCK_ALERT_HEARTBEAT'] = float(os.getenv('STOCK_ALERT_HEARTBEAT', 15))
+app.config['STOCK_ALERT_STREAM_TIMEOUT'] = float(os.getenv('STOCK_ALERT_STREAM_TIMEOUT', 55))
+
+stock_alert_signal = threading.Condition()
+
+
+def is_low_stock(daudzums, reorder_level):
+    return daudzums is not None and reorder_level is not None and float(daudzums) < float(reorder_level)
+
+
+def low_stock_alert(material_id, before, after):
+    # before un after ir pāri (daudzums, reorder_level); brīdinājums tikai, ja mainās stāvoklis
+    was_low = is_low_stock(*before)
+    now_low = is_low_stock(*after)
+    if was_low == now_low:
+        return None
+    return {
+        'material_id': material_id,
+        'kind': 'low' if now_low else 'restored',
+        'daudzums': float(after[0]) if after[0] is not None else None,
+        'reorder_level': float(after[1]) if after[1] is not None else None,
+        'created_at': datetime.datetime.utcnow()
+    }
+
+
+def record_stock_alerts(alerts, session=None):
+    session = session or db.session
+    alerts = [alert for alert in alerts if alert]
+    if alerts:
+        session.connection().execute(db.insert(StockAlert.__table__), alerts)
+        session.info['stock_alerts'] = True
+    return alerts
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def collect_stock_alerts(session, flush_context):
+    alerts = []
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Material):
+            continue
+        state = db.inspect(obj)
+        quantity = state.attrs.daudzums.history
+        level = state.attrs.reorder_level.history
+        if obj in session.new:
+            before = (None, None)
+        elif quantity.has_changes() or level.has_changes():
+            before = (
+                quantity.deleted[0] if quantity.deleted else obj.daudzums,
+                level.deleted[0] if level.deleted else obj.reorder_level
+            )
+        else:
+            continue
+        alerts.append(low_stock_alert(obj.id, before, (obj.daudzums, obj.reorder_level)))
+    record_stock_alerts(alerts, session)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def notify_stock_alerts(session):
+    # Pamodinām šī procesa straumes uzreiz, citi procesi tās atradīs nākamajā aptaujā
+    if session.info.pop('stock_alerts', False):
+        with stock_alert_signal:
+            stock_alert_signal.notify_all()
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_stock_alerts(session):
+    session.info.pop('stock_alerts', None)
+
+
+def take_stock_snapshots(session=None):
+    session = session or db.session
+    last_movement = session.query(
+        StockMovement.material_id,
+        func.max(StockMovement.id).label('movement_id')
+    ).group_by(StockMovement.material_id).subquery()
+    last_snapshot = session.query(
+        StockSnapshot.material_id,
+        func.max(StockSnapshot.movement_id).label('movement_id')
+    ).group_by(StockSnapshot.material_id).subquery()
+
+    # Momentuzņēmums tikai materiāliem, kuriem kopš pēdējā ir jaunas kustības
+    source = db.select(
+        Material.id,
+        Material.daudzums,
+        func.coalesce(last_movement.c.movement_id, 0),
+        db.literal(datetime.datetime.utcnow(), db.DateTime(timezone=True))
+    ).outerjoin(
+        last_movement, last_movement.c.material_id == Material.id
+    ).outerjoin(
+        last_snapshot, last_snapshot.c.material_id == Material.id
+    ).where(db.or_(
+        last_snapshot.c.movement_id.is_(None),
+        func.coalesce(last_movement.c.movement_id, 0) > last_snapshot.c.movement_id
+    ))
+
+    result = session.execute(db.insert(StockSnapshot).from_select(
+        ['material_id', 'daudzums', 'movement_id', 'taken_at'], source
+    ))
+    return result.rowcount
+
+
+# Momentuzņēmumi tiek uzņemti automātiski pirmajā krājumu izmaiņā pēc intervāla; 0 - tikai ar POST /api/stock/snapshots
+app.config['STOCK_SNAPSHOT_INTERVAL'] = float(os.getenv('STOCK_SNAPSHOT_INTERVAL', 86400))
+
+stock_snapshot_due = {'at': None}
+stock_snapshot_lock = threading.Lock()
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def collect_stock_movements(session, flush_context):
+    if any(isinstance(obj, StockMovement) for obj in session.new):
+        session.info['stock_movements'] = True
+
+
+@db.event.listens_for(db.session, 'before_commit')
+def take_due_stock_snapshots(session):
+    interval = app.config['STOCK_SNAPSHOT_INTERVAL']
+    if interval <= 0:
+        return
+    session.flush()
+    if not session.info.pop('stock_movements', False):
+        return
+    with stock_snapshot_lock:
+        if stock_snapshot_due['at'] is not None and time.monotonic() < stock_snapshot_due['at']:
+            return
+        stock_snapshot_due['at'] = time.monotonic() + interval
+
+    # Cits process varēja momentuzņēmumus jau uzņemt
+    latest = session.query(func.max(StockSnapshot.taken_at)).scalar()
+    if latest is not None:
+        age = (datetime.datetime.utcnow() - utc_naive(latest)).total_seconds()
+        if age < interval:
+            stock_snapshot_due['at'] = time.monotonic() + interval - age
+            return
+    take_stock_snapshots(session)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_stock_movements(session):
+    session.info.pop('stock_movements', None)
+
+
+def stock_as_of(as_of, material_id=None):
+    def scoped(query, column):
+        return query.filter(column == material_id) if material_id else query
+
+    # Tuvākais momentuzņēmums pirms datuma: atskaņojam kustības uz priekšu
+    before_ids = scoped(db.session.query(func.max(StockSnapshot.id)), StockSnapshot.material_id) \
+        .filter(StockSnapshot.taken_at <= as_of) \
+        .group_by(StockSnapshot.material_id)
+    before = db.session.query(StockSnapshot.material_id, StockSnapshot.daudzums, StockSnapshot.movement_id) \
+        .filter(StockSnapshot.id.in_(before_ids)).subquery()
+    forward = dict(db.session.query(before.c.material_id, func.sum(StockMovement.delta)).join(
+        StockMovement, db.and_(
+            StockMovement.material_id == before.c.material_id,
+            StockMovement.id > before.c.movement_id,
+            StockMovement.created_at <= as_of
+        )
+    ).group_by(before.c.material_id).all())
+    stock = {
+        row.material_id: (row.daudzums or 0) + (forward.get(row.material_id) or 0)
+        for row in db.session.query(before).all()
+    }
+
+    # Materiāliem bez agrāka momentuzņēmuma: nākamais momentuzņēmums, atskaņojot atpakaļ
+    after_ids = scoped(db.session.query(func.min(StockSnapshot.id)), StockSnapshot.material_id) \
+        .filter(StockSnapshot.taken_at > as_of) \
+        .group_by(StockSnapshot.material_id)
+    after = db.session.query(StockSnapshot.material_id, StockSnapshot.daudzums, StockSnapshot.movement_id) \
+        .filter(StockSnapshot.id.in_(after_ids)).subquery()
+    backward = dict(db.session.query(after.c.material_id, func.sum(StockMovement.delta)).join(
+        StockMovement, db.and_(
+            StockMovement.material_id == after.c.material_id,
+            StockMovement.id <= after.c.movement_id,
+            StockMovement.created_at > as_of
+        )
+    ).group_by(after.c.material_id).all())
+    for row in db.session.query(after).all():
+        if row.material_id not in stock:
+            stock[row.material_id] = (row.daudzums or 0) - (backward.get(row.material_id) or 0)
+
+    # Materiāli bez momentuzņēmumiem: pašreizējie krājumi, atskaņojot atpakaļ vēlākās kustības.
+    # Tā der arī materiāliem, kas izveidoti pirms žurnāla un kuriem nav sākuma kustības
+    snapshotted = db.session.query(StockSnapshot.material_id)
+    unsnapshotted = scoped(db.session.query(StockMovement.material_id), StockMovement.material_id) \
+        .filter(~StockMovement.material_id.in_(snapshotted))
+    current = dict(scoped(db.session.query(Material.id, Material.daudzums), Material.id)
+                   .filter(~Material.id.in_(snapshotted)).all())
+    later = dict(unsnapshotted.with_entities(StockMovement.material_id, func.sum(StockMovement.delta))
+                 .filter(StockMovement.created_at > as_of)
+                 .group_by(StockMovement.material_id).all())
+    existed = {row[0] for row in unsnapshotted.filter(StockMovement.created_at <= as_of).distinct()}
+    created_later = {row[0] for row in unsnapshotted.filter(
+        StockMovement.reason == 'create',
+        StockMovement.created_at > as_of
+    ).distinct()}
+    for unsnapshotted_material_id in (set(current) | existed) - created_later:
+        stock[unsnapshotted_material_id] = (current.get(unsnapshotted_material_id) or 0) \
+            - (later.get(unsnapshotted_material_id) or 0)
+
+    return stock
 
 
 
@@ -149,6 +713,12 @@ def generate_token(user_id):
 def token_required(f):
     @wraps(f)
     def decorator(*args, **kwargs):
+        # /batch apakšpieprasījumi izmanto jau pārbaudīto lietotāju, žetonu atkārtoti neatkodējot
+        batch_user = request.environ.get('kv.batch_user')
+        if batch_user is not None:
+            g.current_user = db.session.merge(batch_user, load=False)
+            return f(g.current_user, *args, **kwargs)
+
         token = request.headers.get('Authorization')
         if not token or not token.startswith("Bearer "):
             return jsonify({"error": "Token is missing or incorrect format!"}), 403
@@ -164,9 +734,320 @@ def token_required(f):
         except jwt.InvalidTokenError:
             return jsonify({"error": "Invalid token"}), 403
 
+        g.current_user = user
         return f(user, *args, **kwargs)
     return decorator
 
+
+replica_state = {'lag': None, 'checked_at': None}
+last_write_at = {}
+
+
+def replica_lag():
+    now = time.monotonic()
+    if replica_state['checked_at'] is not None and now - replica_state['checked_at'] < app.config['REPLICA_LAG_CHECK_INTERVAL']:
+        return replica_state['lag']
+
+    lag = None
+    try:
+        engine = db.engines['replica']
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                lag = conn.execute(db.text(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                )).scalar()
+            else:
+                conn.execute(db.text("SELECT 1"))
+                lag = 0
+    except Exception as e:
+        logging.warning(f"Replica lag check failed: {str(e)}")
+
+    replica_state['lag'] = float(lag) if lag is not None else None
+    replica_state['checked_at'] = now
+    return replica_state['lag']
+
+
+def recently_wrote(user):
+    written_at = last_write_at.get(user.id) if user else None
+    return written_at is not None and time.monotonic() - written_at < app.config['REPLICA_STICKY_SECONDS']
+
+
+def read_replica(f):
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        if app.config['REPLICA_DATABASE_URL'] and not recently_wrote(g.get('current_user')):
+            # Ja replika atpaliek vai nav sasniedzama, lasām no primārās datubāzes
+            lag = replica_lag()
+            g.use_replica = lag is not None and lag <= app.config['REPLICA_MAX_LAG']
+        return f(*args, **kwargs)
+    return decorator
+
+
+@app.after_request
+def track_writes(response):
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        user = g.get('current_user')
+        if user:
+            last_write_at[user.id] = time.monotonic()
+    if app.config['REPLICA_DATABASE_URL']:
+        response.headers['X-Read-Source'] = 'replica' if g.get('use_replica') else 'primary'
+    return response
+
+# Slodzes ierobežošana: vienlaicīgu pieprasījumu limits maršruta klasei un lietotāja žetonu spainis
+ADMISSION_CLASSES = {
+    # klase: vienlaicīgi pieprasījumi procesā, žetoni sekundē uz lietotāju, spaiņa izmērs, Retry-After pie 503
+    'export': {'concurrency': 2, 'rate': 0.2, 'burst': 3, 'retry_after': 5},
+    'auth': {'concurrency': 4, 'rate': 0.5, 'burst': 5, 'retry_after': 2},
+    'report': {'concurrency': 8, 'rate': 2, 'burst': 10, 'retry_after': 1},
+}
+ADMISSION_CLASSES.update({
+    name: {**ADMISSION_CLASSES.get(name, {}), **limits}
+    for name, limits in json.loads(os.getenv('ADMISSION_LIMITS', '{}')).items()
+})
+app.config['ADMISSION_ENABLED'] = os.getenv('ADMISSION_ENABLED', '1') == '1'
+app.config['ADMISSION_REDIS_URL'] = os.getenv('ADMISSION_REDIS_URL')
+# Cik ilgi kopīgajā krātuvē glabājas neatbrīvota vieta, ja process nomirst pieprasījuma laikā
+app.config['ADMISSION_SLOT_TTL'] = int(os.getenv('ADMISSION_SLOT_TTL', 300))
+# Uzticamo starpniekserveru skaits priekšā lietotnei; tikai no tiem pieņemam X-Forwarded-For
+app.config['TRUSTED_PROXY_HOPS'] = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+if app.config['TRUSTED_PROXY_HOPS'] > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
+
+
+class LocalLimiter:
+    max_buckets = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.buckets = {}
+
+    def acquire(self, name, limit):
+        with self.lock:
+            if self.active.get(name, 0) >= limit:
+                return None
+            self.active[name] = self.active.get(name, 0) + 1
+            return True
+
+    def release(self, name, holder):
+        with self.lock:
+            self.active[name] = max(self.active.get(name, 1) - 1, 0)
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key, (burst, now, 0))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, now + burst / rate)
+            if len(self.buckets) > self.max_buckets:
+                # Spaiņi, kas jau būtu pilni, neko neglabā, tos var izmest
+                self.buckets = {k: v for k, v in self.buckets.items() if v[2] > now}
+        return allowed, 0 if allowed else math.ceil((1 - tokens) / rate)
+
+
+class RedisLimiter:
+    token_bucket_script = """
+        local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[2])
+        local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or ARGV[3])
+        tokens = math.min(tonumber(ARGV[2]), tokens + math.max(0, tonumber(ARGV[3]) - updated) * tonumber(ARGV[1]))
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', ARGV[3])
+        redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2]) / tonumber(ARGV[1])) + 1)
+        return {allowed, tostring(tokens)}
+    """
+
+    # Katrai aizņemtajai vietai savs ieraksts ar laiku, lai neatbrīvotās vietas noilgst pa vienai
+    slot_script = """
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[3]) - tonumber(ARGV[4]))
+        if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+            return 0
+        end
+        redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+        redis.call('EXPIRE', KEYS[1], ARGV[4])
+        return 1
+    """
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self.token_bucket = self.client.register_script(self.token_bucket_script)
+        self.slot = self.client.register_script(self.slot_script)
+
+    def acquire(self, name, limit):
+        holder = uuid.uuid4().hex
+        acquired = self.slot(
+            keys=[f'admission:active:{name}'],
+            args=[limit, holder, time.time(), app.config['ADMISSION_SLOT_TTL']]
+        )
+        return holder if acquired else None
+
+    def release(self, name, holder):
+        self.client.zrem(f'admission:active:{name}', holder)
+
+    def take(self, key, rate, burst):
+        allowed, tokens = self.token_bucket(keys=[f'admission:bucket:{key}'], args=[rate, burst, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0 if allowed else math.ceil((1 - tokens) / rate)
+
+
+local_limiter = LocalLimiter()
+shared_limiter = None
+if app.config['ADMISSION_REDIS_URL'] and redis:
+    shared_limiter = RedisLimiter(app.config['ADMISSION_REDIS_URL'])
+elif app.config['ADMISSION_REDIS_URL']:
+    logging.warning("ADMISSION_REDIS_URL is set but redis is not installed, using local limits")
+
+
+def limiter_call(method, *args):
+    if shared_limiter:
+        try:
+            return getattr(shared_limiter, method)(*args)
+        except Exception as e:
+            logging.warning(f"Admission backend error, using local limits: {str(e)}")
+    return getattr(local_limiter, method)(*args)
+
+
+def acquire_slot(name, limit):
+    # Atceramies krātuvi, kas piešķīra vietu, lai to atbrīvotu tajā pašā
+    if shared_limiter:
+        try:
+            holder = shared_limiter.acquire(name, limit)
+            return (shared_limiter, holder) if holder else None
+        except Exception as e:
+            logging.warning(f"Admission backend error, using local limits: {str(e)}")
+    holder = local_limiter.acquire(name, limit)
+    return (local_limiter, holder) if holder else None
+
+
+def release_slot(name, slot):
+    limiter, holder = slot
+    try:
+        limiter.release(name, holder)
+    except Exception as e:
+        # Kopīgajā krātuvē vieta noilgs pēc ADMISSION_SLOT_TTL
+        logging.warning(f"Admission backend error on release: {str(e)}")
+
+
+def client_key():
+    user = g.get('current_user')
+    if user:
+        return f'user:{user.id}'
+    # Klienta galveni nelasām paši, citādi to mainot katram mēģinājumam var iegūt jaunu spaini
+    return f"ip:{request.remote_addr}"
+
+
+def rejected(status, message, retry_after):
+    response = jsonify({"error": message})
+    response.headers['Retry-After'] = str(max(int(retry_after), 1))
+    return response, status
+
+
+def admission(name):
+    def wrapper(f):
+        @wraps(f)
+        def decorator(*args, **kwargs):
+            limits = ADMISSION_CLASSES[name]
+            if not app.config['ADMISSION_ENABLED']:
+                return f(*args, **kwargs)
+
+            allowed, retry_after = limiter_call('take', f'{name}:{client_key()}', limits['rate'], limits['burst'])
+            if not allowed:
+                return rejected(429, "Pārāk daudz pieprasījumu, mēģiniet vēlāk", retry_after)
+
+            # Neliekam pieprasījumu rindā: ja visas vietas aizņemtas, atbildam uzreiz
+            slot = acquire_slot(name, limits['concurrency'])
+            if not slot:
+                return rejected(503, "Serveris ir pārslogots, mēģiniet vēlāk", limits['retry_after'])
+            try:
+                return f(*args, **kwargs)
+            finally:
+                release_slot(name, slot)
+        return decorator
+    return wrapper
+
+
+# Vienādu vienlaicīgu GET pieprasījumu apvienošana (single-flight) ar īslaicīgu kešu
+app.config['COALESCE_CACHE_TTL'] = float(os.getenv('COALESCE_CACHE_TTL', 1))
+app.config['COALESCE_WAIT_TIMEOUT'] = float(os.getenv('COALESCE_WAIT_TIMEOUT', 30))
+app.config['COALESCE_CACHE_SIZE'] = int(os.getenv('COALESCE_CACHE_SIZE', 256))
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+coalesce_lock = threading.Lock()
+in_flight = {}
+micro_cache = {}
+coalesce_stats = {'hits': 0, 'coalesced': 0, 'misses': 0}
+
+
+def shared_response(result):
+    data, status, headers = result
+    return app.response_class(data, status=status, headers=headers)
+
+
+def coalesce(ttl=None):
+    def wrapper(f):
+        @wraps(f)
+        def decorator(*args, **kwargs):
+            # Lietotājam, kurš nupat rakstīja, kopīgu (iespējams, pirms ieraksta aprēķinātu) atbildi nedodam
+            if recently_wrote(g.get('current_user')):
+                return f(*args, **kwargs)
+            cache_ttl = app.config['COALESCE_CACHE_TTL'] if ttl is None else ttl
+            # Replikas un primārās datubāzes atbildes nejaucam
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), bool(g.get('use_replica')))
+
+            with coalesce_lock:
+                cached = micro_cache.get(key)
+                if cached and cached[0] > time.monotonic():
+                    coalesce_stats['hits'] += 1
+                    return shared_response(cached[1])
+                flight = in_flight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = in_flight[key] = Flight()
+                    coalesce_stats['misses'] += 1
+                else:
+                    coalesce_stats['coalesced'] += 1
+
+            if not leader:
+                # Gaidām pirmā pieprasījuma rezultātu; ja tas neizdevās, rēķinām paši
+                if flight.done.wait(app.config['COALESCE_WAIT_TIMEOUT']) and flight.result:
+                    return shared_response(flight.result)
+                return f(*args, **kwargs)
+
+            try:
+                response = make_response(f(*args, **kwargs))
+                # Kļūdas atbildi gaidītājiem nenododam, tie to pārrēķina paši
+                if 200 <= response.status_code < 300:
+                    flight.result = (response.get_data(), response.status_code, list(response.headers.items()))
+            finally:
+                with coalesce_lock:
+                    in_flight.pop(key, None)
+                    if flight.result and flight.result[1] == 200 and cache_ttl > 0:
+                        now = time.monotonic()
+                        micro_cache[key] = (now + cache_ttl, flight.result)
+                        if len(micro_cache) > app.config['COALESCE_CACHE_SIZE']:
+                            for stale in [k for k, (expires, _) in micro_cache.items() if expires <= now]:
+                                del micro_cache[stale]
+                            while len(micro_cache) > app.config['COALESCE_CACHE_SIZE']:
+                                del micro_cache[next(iter(micro_cache))]
+                flight.done.set()
+            return response
+        return decorator
+    return wrapper
+
+
 @app.route('/api/shifts/stats', methods=['OPTIONS'])
 def shifts_stats_options():
     response = jsonify({'message': 'CORS preflight'})
@@ -178,6 +1059,9 @@ def shifts_stats_options():
 
 @app.route('/api/shifts/stats', methods=['GET'])
 @token_required
+@read_replica
+@coalesce()
+@admission('report')
 def get_shifts_stats(current_user):
     try:
         start = request.args.get('start')
@@ -219,14 +1103,148 @@ def get_shifts_stats(current_user):
 
 
 
+SHIFT_BUCKETS = {
+    # bucket: (Postgres date_trunc vienība, solis, SQLite sākuma modifikatori, SQLite soļa modifikators)
+    'day': ('day', '1 day', "'start of day'", "'+1 day'"),
+    'week': ('week', '1 week', "'start of day', 'weekday 0', '-6 days'", "'+7 days'"),
+    'month': ('month', '1 month', "'start of month'", "'+1 month'"),
+}
+
+
+def shift_hours_query(bucket, start_date, end_date, employee_id):
+    trunc, step, sqlite_start, sqlite_step = SHIFT_BUCKETS[bucket]
+    params = {}
+    filters = ["start_time IS NOT NULL", "end_time IS NOT NULL", "end_time > start_time"]
+
+    if db.engine.dialect.name == 'postgresql':
+        if start_date:
+            filters.append("end_time > :start")
+            params['start'] = start_date
+        if end_date:
+            filters.append("start_time < :end")
+            params['end'] = end_date
+        if employee_id:
+            filters.append("employee_id = :employee_id")
+            params['employee_id'] = employee_id
+
+        # generate_series sadala katru maiņu pa periodiem, tāpēc maiņas pāri pusnaktij tiek dalītas
+        lower = "GREATEST(s.start_time, b.bucket_start" + (", :start" if start_date else "") + ")"
+        upper = f"LEAST(s.end_time, b.bucket_start + INTERVAL '{step}'" + (", :end" if end_date else "") + ")"
+        sql = f"""
+            SELECT employee_id, bucket, SUM(seconds) / 3600.0 AS hours
+            FROM (
+                SELECT s.employee_id,
+                       to_char(b.bucket_start, 'YYYY-MM-DD') AS bucket,
+                       EXTRACT(EPOCH FROM {upper} - {lower}) AS seconds
+                FROM (SELECT * FROM shifts WHERE {' AND '.join(filters)}) s
+                CROSS JOIN LATERAL generate_series(
+                    date_trunc('{trunc}', s.start_time), s.end_time, INTERVAL '{step}'
+                ) AS b(bucket_start)
+            ) parts
+            WHERE seconds > 0
+            GROUP BY employee_id, bucket
+            ORDER BY employee_id, bucket
+        """
+    else:
+        if start_date:
+            filters.append("julianday(end_time) > julianday(:start)")
+            params['start'] = start_date.isoformat()
+        if end_date:
+            filters.append("julianday(start_time) < julianday(:end)")
+            params['end'] = end_date.isoformat()
+        if employee_id:
+            filters.append("employee_id = :employee_id")
+            params['employee_id'] = employee_id
+
+        lower = "MAX(julianday(start_time), julianday(bucket_start)" + (", julianday(:start)" if start_date else "") + ")"
+        upper = f"MIN(julianday(end_time), julianday(bucket_start, {sqlite_step})" + (", julianday(:end)" if end_date else "") + ")"
+        sql = f"""
+            WITH RECURSIVE parts(employee_id, start_time, end_time, bucket_start) AS (
+                SELECT employee_id, start_time, end_time, datetime(start_time, {sqlite_start})
+                FROM shifts
+                WHERE {' AND '.join(filters)}
+                UNION ALL
+                SELECT employee_id, start_time, end_time, datetime(bucket_start, {sqlite_step})
+                FROM parts
+                WHERE julianday(bucket_start, {sqlite_step}) < julianday(end_time)
+            )
+            SELECT employee_id, bucket, SUM(days) * 24 AS hours
+            FROM (
+                SELECT employee_id,
+                       strftime('%Y-%m-%d', bucket_start) AS bucket,
+                       {upper} - {lower} AS days
+                FROM parts
+            )
+            WHERE days > 0
+            GROUP BY employee_id, bucket
+            ORDER BY employee_id, bucket
+        """
+
+    return db.session.execute(db.text(sql), params).all()
+
+
+@app.route('/api/shifts/hours', methods=['GET'])
+@token_required
+@read_replica
+@coalesce()
+@admission('report')
+def get_shift_hours(current_user):
+    try:
+        bucket = request.args.get('bucket', 'day')
+        if bucket not in SHIFT_BUCKETS:
+            return jsonify({"error": "Nederīgs periods, atļauts: day, week, month"}), 400
+
+        start = request.args.get('start')
+        end = request.args.get('end')
+        employee_id = request.args.get('employee_id', type=int)
+
+        start_date = parser.parse(start) if start else None
+        end_date = parser.parse(end) if end else None
+
+        rows = shift_hours_query(bucket, start_date, end_date, employee_id)
+
+        employee_ids = {row.employee_id for row in rows}
+        employees = {
+            emp.id: emp
+            for emp in Employee.query.filter(Employee.id.in_(employee_ids)).all()
+        } if employee_ids else {}
+
+        result = {}
+        for row in rows:
+            entry = result.get(row.employee_id)
+            if entry is None:
+                emp = employees.get(row.employee_id)
+                entry = result[row.employee_id] = {
+                    "id": row.employee_id,
+                    "vards": emp.vards if emp else None,
+                    "uzvards": emp.uzvards if emp else None,
+                    "amats": emp.amats if emp else None,
+                    "total": 0,
+                    "hours": {}
+                }
+            hours = round(float(row.hours), 2)
+            entry["hours"][row.bucket] = hours
+            entry["total"] = round(entry["total"] + hours, 2)
+
+        return jsonify({"bucket": bucket, "employees": list(result.values())}), 200
+
+    except Exception as e:
+        logging.error(f"Shift hours error: {str(e)}")
+        return jsonify({"error": "Neizdevās aprēķināt stundas"}), 500
+
+
+
 @app.route("/api/stats/materials", methods=["GET"])
 @token_required
+@read_replica
+@coalesce()
+@admission('report')
 def get_material_stats(current_user):
     try:
         results = db.session.query(
             Material.id,
             Material.nosaukums,
-            db.func.sum(OrderMaterial.daudzums * Order.daudzums).label("total")
+            db.func.sum(db.func.coalesce(OrderMaterial.quantity, OrderMaterial.daudzums * Order.daudzums)).label("total")
         ).join(OrderMaterial, Material.id == OrderMaterial.material_id) \
          .join(Order, Order.id == OrderMaterial.order_id) \
          .group_by(Material.id, Material.nosaukums) \
@@ -250,11 +1268,37 @@ def get_material_stats(current_user):
 
 
 
+@app.route("/api/stats/coalescing", methods=["GET"])
+@token_required
+def get_coalescing_stats(current_user):
+    with coalesce_lock:
+        stats = dict(coalesce_stats)
+        stats['in_flight'] = len(in_flight)
+        stats['cached'] = len(micro_cache)
+    total = stats['hits'] + stats['coalesced'] + stats['misses']
+    stats['hit_rate'] = round((stats['hits'] + stats['coalesced']) / total, 4) if total else 0
+    return jsonify(stats), 200
+
+
+@app.route("/api/stats/cache", methods=["GET"])
+@token_required
+def get_cache_stats(current_user):
+    stats = {}
+    for kind, counters in cache_stats.items():
+        lookups = counters['hits'] + counters['misses']
+        stats[kind] = {**counters, 'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0}
+    stats['backend'] = type(cache_backend).__name__
+    if isinstance(cache_backend, LRUCache):
+        stats['entries'] = len(cache_backend.entries)
+        stats['bytes'] = cache_backend.size
+    return jsonify(stats), 200
+
+
 @app.route("/login", methods=["POST"])
+@admission('auth')
 def login():
     try:
         data = request.get_json()
-        print("Received data:", data)  
         if not data:
             return jsonify({"error": "No JSON body received"}), 400
 
@@ -290,10 +1334,11 @@ def login():
             "redirect": "/admin" if user.amats == "Administrators" else "/home"
         }), 200
     except Exception as e:
-        print("Error during login:", str(e))
+        logging.error(f"Error during login: {str(e)}")
         return jsonify({"error": "Server error"}), 500
 
 @app.route("/login/password", methods=["POST"])
+@admission('auth')
 def login_with_password():
     try:
         data = request.get_json()
@@ -347,40 +1392,424 @@ def logout(current_user):
     return jsonify({"success": True, "message": "Logout successful"}), 200
 
 
+# Kopīgs saraksta vaicājumu slānis: filtri, kārtošana un LIMIT tiek izpildīti datubāzē
+MAX_LIST_LIMIT = 10000
+
+LIST_QUERY_SPECS = {
+    'orders': {
+        'model': Order,
+        'sort': {
+            'id': Order.id,
+            'nosaukums': Order.nosaukums,
+            'daudzums': Order.daudzums,
+            'status': Order.status,
+            'employee_id': Order.employee_id,
+            'created_at': Order.created_at,
+            'updated_at': Order.updated_at,
+        },
+        'filters': {'status': Order.status, 'employee_id': Order.employee_id},
+        'search': [Order.nosaukums],
+        'date': Order.created_at,
+    },
+    'materials': {
+        'model': Material,
+        'sort': {
+            'id': Material.id,
+            'nosaukums': Material.nosaukums,
+            'daudzums': Material.daudzums,
+            'vieniba': Material.vieniba,
+            'noliktava': Material.noliktava,
+            'vieta': Material.vieta,
+            'reorder_level': Material.reorder_level,
+        },
+        'filters': {'noliktava': Material.noliktava, 'vieta': Material.vieta, 'vieniba': Material.vieniba},
+        'search': [Material.nosaukums],
+        'date': None,
+    },
+    'workers': {
+        'model': Employee,
+        'sort': {
+            'id': Employee.id,
+            'vards': Employee.vards,
+            'uzvards': Employee.uzvards,
+            'amats': Employee.amats,
+            'kods': Employee.kods,
+            'status': Employee.status,
+        },
+        'filters': {'status': Employee.status, 'amats': Employee.amats, 'employee_id': Employee.id},
+        'search': [func.coalesce(Employee.vards, '') + ' ' + func.coalesce(Employee.uzvards, '')],
+        'date': None,
+    },
+}
+
+
+@db.event.listens_for(db.Engine, 'connect')
+def sqlite_unicode_lower(dbapi_connection, connection_record):
+    # SQLite lower() saprot tikai ASCII, bet meklēšanai vajag arī garumzīmes (Ū -> ū)
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('lower', 1, lambda value: value.lower() if isinstance(value, str) else value, deterministic=True)
+
+
+def shift_hours_expr():
+    if db.engine.dialect.name == 'postgresql':
+        return func.extract('epoch', Shift.end_time - Shift.start_time) / 3600
+    return (func.julianday(Shift.end_time) - func.julianday(Shift.start_time)) * 24
+
+
+def apply_list_params(query, spec, args, default_sort=None, sort_columns=None, tiebreaker=None):
+    for name, column in spec['filters'].items():
+        values = args.getlist(name)
+        if not values:
+            continue
+        try:
+            values = [column.type.python_type(value) for value in values]
+        except (ValueError, NotImplementedError):
+            raise ValueError(f'Nederīga filtra vērtība: {name}')
+        query = query.filter(column.in_(values) if len(values) > 1 else column == values[0])
+
+    search = args.get('search', '').strip()
+    if search:
+        query = query.filter(db.or_(*[column.icontains(search, autoescape=True) for column in spec['search']]))
+
+    if spec.get('date') is not None:
+        start = args.get('start_date')
+        end = args.get('end_date')
+        if start:
+            query = query.filter(spec['date'] >= parser.parse(start))
+        if end:
+            query = query.filter(spec['date'] <= parser.parse(end))
+
+    sortable = sort_columns or spec['sort']
+    sort_by = args.get('sort_by') or default_sort
+    if sort_by:
+        if sort_by not in sortable:
+            raise ValueError(f'Nederīgs kārtošanas lauks, atļauts: {", ".join(sortable)}')
+        column = sortable[sort_by]
+        query = query.order_by(column.desc() if args.get('sort_order') == 'desc' else column.asc())
+    # Stabila secība vienādām vērtībām
+    query = query.order_by(tiebreaker if tiebreaker is not None else spec['model'].id)
+
+    limit = args.get('limit', type=int)
+    offset = args.get('offset', type=int)
+    if limit is not None:
+        query = query.limit(max(0, min(limit, MAX_LIST_LIMIT)))
+    if offset:
+        query = query.offset(max(0, offset))
+    return query
+
+
+def list_query(kind, args, default_sort=None):
+    spec = LIST_QUERY_SPECS[kind]
+    return apply_list_params(spec['model'].query, spec, args, default_sort)
+
+
+# Retinātas atbildes: ?fields= nosaka atlasāmās kolonnas, ?include=materials pievieno pasūtījuma materiālus
+MATERIAL_FIELDS = ('id', 'nosaukums', 'noliktava', 'vieta', 'vieniba', 'daudzums', 'reorder_level', 'version')
+ORDER_FIELDS = ('id', 'nosaukums', 'daudzums', 'employee_id', 'status', 'created_at', 'updated_at')
+ORDER_MATERIAL_FIELDS = ('id', 'nosaukums', 'noliktava', 'vieta', 'vieniba', 'daudzums', 'version', 'quantity', 'material_version')
+ORDER_INCLUDES = ('materials',)
+
+
+def requested_fields(value, allowed):
+    if value is None:
+        return list(allowed)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Nezināms lauks: {', '.join(unknown)}")
+    # id vienmēr ir vajadzīgs, lai klients varētu sasaistīt ierakstus
+    return ['id'] + [name for name in dict.fromkeys(fields) if name != 'id']
+
+
+def field_value(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def material_shape(args):
+    return requested_fields(args.get('fields'), MATERIAL_FIELDS)
+
+
+def order_shape(args):
+    fields = requested_fields(args.get('fields'), ORDER_FIELDS + ORDER_INCLUDES)
+    if args.get('include') is None and args.get('fields') is None:
+        # Bez parametriem atbilde ir tāda pati kā līdz šim, ar materiāliem
+        include = list(ORDER_INCLUDES)
+    else:
+        include = requested_fields(args.get('include') or '', ORDER_INCLUDES)[1:]
+    include += [name for name in ORDER_INCLUDES if name in fields and name not in include]
+    fields = [name for name in fields if name not in ORDER_INCLUDES]
+    material_fields = requested_fields(args.get('fields[materials]'), ORDER_MATERIAL_FIELDS) if 'materials' in include else None
+    return fields, material_fields
+
+
+def shaped_query(model, fields):
+    return model.query.options(load_only(*[getattr(model, name) for name in fields]))
+
+
+def order_materials(order_ids, material_fields):
+    # Viens vaicājums visiem pasūtījumiem, atlasot tikai pieprasītās kolonnas
+    if not order_ids:
+        return {}
+    columns = [
+        getattr(OrderMaterial if name in ('quantity', 'material_version') else Material, name).label(name)
+        for name in material_fields
+    ]
+    rows = db.session.query(OrderMaterial.order_id.label('order_ref'), *columns).join(
+        Material, Material.id == OrderMaterial.material_id
+    ).filter(OrderMaterial.order_id.in_(order_ids)).order_by(OrderMaterial.order_id, OrderMaterial.material_id)
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.order_ref, []).append({name: getattr(row, name) for name in material_fields})
+    return grouped
+
+
+def shaped_orders(orders, fields, material_fields):
+    materials = order_materials([order.id for order in orders], material_fields) if material_fields else None
+    result = []
+    for order in orders:
+        item = {name: field_value(getattr(order, name)) for name in fields}
+        if materials is not None:
+            item['materials'] = materials.get(order.id, [])
+        result.append(item)
+    return result
+
+
+def shift_totals_query(args, default_sort=None):
+    hours = func.sum(shift_hours_expr()).label('hours')
+    query = db.session.query(
+        Employee.vards, Employee.uzvards, Employee.amats, hours
+    ).join(Shift, Shift.employee_id == Employee.id).filter(
+        Shift.start_time.isnot(None),
+        Shift.end_time.isnot(None)
+    )
+    start = args.get('start_date')
+    end = args.get('end_date')
+    if start:
+        query = query.filter(Shift.start_time >= parser.parse(start))
+    if end:
+        query = query.filter(Shift.end_time <= parser.parse(end))
+    query = query.group_by(Employee.id, Employee.vards, Employee.uzvards, Employee.amats).having(hours > 0)
+
+    spec = {**LIST_QUERY_SPECS['workers'], 'model': None, 'filters': {'amats': Employee.amats, 'employee_id': Employee.id}}
+    sort_columns = {
+        'vards': Employee.vards,
+        'uzvards': Employee.uzvards,
+        'amats': Employee.amats,
+        'hours': hours,
+    }
+    return apply_list_params(query, spec, args, default_sort, sort_columns=sort_columns, tiebreaker=Employee.id)
+
+
+# Izziņu datu kešs (darbinieki, materiāli) ar invalidāciju pēc commit
+app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'local')
+app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL')
+app.config['CACHE_TTL'] = int(os.getenv('CACHE_TTL', 300))
+# Lokālajam kešam invalidācija nesasniedz citus procesus, tāpēc dzīves laiks ir īss; koplietotam izmanto redis
+app.config['CACHE_LOCAL_TTL'] = int(os.getenv('CACHE_LOCAL_TTL', 5))
+app.config['CACHE_MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+app.config['CACHE_MAX_BYTES'] = int(os.getenv('CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+CACHE_ITEM_ARGS = ('fields',)
+
+
+class LRUCache:
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generations = {}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.size += len(value)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self._remove(key)
+
+    def generation(self, name):
+        return self.generations.get(name, 0)
+
+    def bump_generation(self, name):
+        with self.lock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= len(entry[1])
+
+
+class RedisCache:
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2)
+
+    def get(self, key):
+        return self.client.get(f'cache:{key}')
+
+    def set(self, key, value, ttl):
+        self.client.set(f'cache:{key}', value, ex=ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[f'cache:{key}' for key in keys])
+
+    def generation(self, name):
+        return int(self.client.get(f'cache:gen:{name}') or 0)
+
+    def bump_generation(self, name):
+        self.client.incr(f'cache:gen:{name}')
+
+
+if app.config['CACHE_BACKEND'] == 'redis' and app.config['CACHE_REDIS_URL'] and redis:
+    cache_backend = RedisCache(app.config['CACHE_REDIS_URL'])
+else:
+    if app.config['CACHE_BACKEND'] == 'redis':
+        logging.warning("Redis cache requested but not available, using local cache")
+    cache_backend = LRUCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_MAX_BYTES'])
+
+cache_stats = {kind: {'hits': 0, 'misses': 0, 'invalidations': 0} for kind in ('materials', 'employees')}
+cache_invalidated_at = {}
+
+
+def cache_call(method, *args):
+    try:
+        return getattr(cache_backend, method)(*args)
+    except Exception as e:
+        logging.warning(f"Cache backend error: {str(e)}")
+        return None
+
+
+def mark_cache_dirty(kind, ids):
+    db.session.info.setdefault('cache_dirty', {}).setdefault(kind, set()).update(ids)
+
+
+def cache_ttl():
+    if isinstance(cache_backend, LRUCache):
+        return min(app.config['CACHE_TTL'], app.config['CACHE_LOCAL_TTL'])
+    return app.config['CACHE_TTL']
+
+
+def invalidate_cache(kind, ids):
+    for item_id in ids:
+        cache_call('bump_generation', f'{kind}:{item_id}')
+    cache_call('bump_generation', kind)
+    cache_stats[kind]['invalidations'] += 1
+    cache_invalidated_at[kind] = time.monotonic()
+
+
+EMPLOYEE_CACHED_FIELDS = ('vards', 'uzvards', 'amats', 'kods', 'status')
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def collect_cache_changes(session, flush_context):
+    dirty = session.info.setdefault('cache_dirty', {})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Material):
+            dirty.setdefault('materials', set()).add(obj.id)
+        elif isinstance(obj, Employee):
+            # Pieteikšanās maina tikai token lauku, tas kešu neietekmē
+            state = db.inspect(obj)
+            if obj in session.dirty and not any(state.attrs[field].history.has_changes() for field in EMPLOYEE_CACHED_FIELDS):
+                continue
+            dirty.setdefault('employees', set()).add(obj.id)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def apply_cache_invalidation(session):
+    # Invalidējam tikai pēc commit, lai paralēls lasītājs neieliek kešā vecos datus
+    for kind, ids in session.info.pop('cache_dirty', {}).items():
+        invalidate_cache(kind, ids)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_cache_changes(session):
+    session.info.pop('cache_dirty', None)
+
+
+def cached(kind, item_arg=None):
+    def wrapper(f):
+        @wraps(f)
+        def decorator(*args, **kwargs):
+            if item_arg:
+                # Ierakstam sava paaudze: lasītājs, kas datus nolasīja pirms commit, tos ieliek jau novecojušā atslēgā
+                item_id = kwargs[item_arg]
+                # Atslēgā tikai parametri, kas maina atbildi, lai piem. kešu apejoši parametri neradītu jaunus ierakstus
+                query = urlencode(sorted((key, value) for key, value in request.args.items(multi=True) if key in CACHE_ITEM_ARGS))
+                key = f'{kind}:item:{item_id}:{cache_call("generation", f"{kind}:{item_id}") or 0}:{query}'
+            else:
+                query = urlencode(sorted(request.args.items(multi=True)))
+                key = f'{kind}:list:{cache_call("generation", kind) or 0}:{query}'
+
+            value = cache_call('get', key)
+            if value is not None:
+                cache_stats[kind]['hits'] += 1
+                response = app.response_class(value, mimetype='application/json')
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            cache_stats[kind]['misses'] += 1
+            response = make_response(f(*args, **kwargs))
+            # Replika var vēl neredzēt tikko veiktās izmaiņas, tādēļ tās rezultātu nekešojam uzreiz pēc invalidācijas
+            recently_invalidated = time.monotonic() - cache_invalidated_at.get(kind, float('-inf')) < app.config['REPLICA_MAX_LAG']
+            if response.status_code == 200 and not (g.get('use_replica') and recently_invalidated):
+                cache_call('set', key, response.get_data(), cache_ttl())
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return decorator
+    return wrapper
+
+
 @app.route("/materials", methods=["GET"])
 @token_required
+@read_replica
+@cached('materials')
 def get_materials(current_user):
     try:
-        materials = Material.query.all()
-        return jsonify([{
-            'id': material.id,
-            'nosaukums': material.nosaukums,
-            'noliktava': material.noliktava,
-            'vieta': material.vieta,
-            'vieniba': material.vieniba,
-            'daudzums': material.daudzums,
-            'version': material.version
-        } for material in materials]), 200
+        fields = material_shape(request.args)
+        spec = LIST_QUERY_SPECS['materials']
+        materials = apply_list_params(shaped_query(Material, fields), spec, request.args).all()
+        return jsonify([{name: getattr(material, name) for name in fields} for material in materials]), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting materials: {str(e)}")
         return jsonify({"error": "Neizdevās iegūt materiālus", "details": str(e)}), 500
 @app.route("/materials/<int:material_id>", methods=["GET"])
 @token_required
+@read_replica
+@cached('materials', item_arg='material_id')
 def get_material(current_user, material_id):
     try:
-        material = Material.query.get(material_id)
+        fields = material_shape(request.args)
+        material = shaped_query(Material, fields).filter(Material.id == material_id).first()
         if not material:
             return jsonify({"error": "Materiāls nav atrasts"}), 404
-            
-        return jsonify({
-            'id': material.id,
-            'nosaukums': material.nosaukums,
-            'noliktava': material.noliktava,
-            'vieta': material.vieta,
-            'vieniba': material.vieniba,
-            'daudzums': material.daudzums,
-            'version': material.version
-        }), 200
+
+        return jsonify({name: getattr(material, name) for name in fields}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting material: {str(e)}")
         return jsonify({"error": "Neizdevās iegūt materiālu", "details": str(e)}), 500
@@ -390,42 +1819,16 @@ def get_material(current_user, material_id):
 
 @app.route("/orders", methods=["GET"])
 @token_required
+@read_replica
 def get_orders(current_user):
     try:
-        orders = Order.query.all()
-        orders_list = []
-        
-        for order in orders:
-            # Iegūstam materiālus ar versijām
-            materials = []
-            for order_material in order.materials:
-                material = Material.query.get(order_material.material_id)
-                if material:
-                    materials.append({
-                        'id': material.id,
-                        'nosaukums': material.nosaukums,
-                        'noliktava': material.noliktava,
-                        'vieta': material.vieta,
-                        'vieniba': material.vieniba,
-                        'daudzums': material.daudzums,
-                        'version': material.version,
-                        'quantity': order_material.quantity,
-                        'material_version': order_material.material_version
-                    })
-
-            orders_list.append({
-                'id': order.id,
-                'nosaukums': order.nosaukums,
-                'daudzums': order.daudzums,
-                'employee_id': order.employee_id,
-                'status': order.status,
-                'created_at': order.created_at.isoformat(),
-                'updated_at': order.updated_at.isoformat(),
-                'materials': materials
-            })
-
-        return jsonify(orders_list), 200
+        fields, material_fields = order_shape(request.args)
+        spec = LIST_QUERY_SPECS['orders']
+        orders = apply_list_params(shaped_query(Order, fields), spec, request.args).all()
+        return jsonify(shaped_orders(orders, fields, material_fields)), 200
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting orders: {str(e)}")
         return jsonify({"error": "Neizdevās iegūt pasūtījumus", "details": str(e)}), 500
@@ -433,40 +1836,18 @@ def get_orders(current_user):
 
 @app.route("/orders/<int:order_id>", methods=["GET"])
 @token_required
+@read_replica
 def get_order(current_user, order_id):
     try:
-        order = Order.query.get(order_id)
+        fields, material_fields = order_shape(request.args)
+        order = shaped_query(Order, fields).filter(Order.id == order_id).first()
         if not order:
             return jsonify({'error': 'Pasūtījums nav atrasts'}), 404
 
-        # Iegūstam materiālus ar versijām
-        materials = []
-        for order_material in order.materials:
-            material = Material.query.get(order_material.material_id)
-            if material:
-                materials.append({
-                    'id': material.id,
-                    'nosaukums': material.nosaukums,
-                    'noliktava': material.noliktava,
-                    'vieta': material.vieta,
-                    'vieniba': material.vieniba,
-                    'daudzums': material.daudzums,
-                    'version': material.version,
-                    'quantity': order_material.quantity,
-                    'material_version': order_material.material_version
-                })
-
-        return jsonify({
-            'id': order.id,
-            'nosaukums': order.nosaukums,
-            'daudzums': order.daudzums,
-            'employee_id': order.employee_id,
-            'status': order.status,
-            'created_at': order.created_at.isoformat(),
-            'updated_at': order.updated_at.isoformat(),
-            'materials': materials
-        }), 200
+        return jsonify(shaped_orders([order], fields, material_fields)[0]), 200
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error getting order: {str(e)}")
         return jsonify({"error": "Neizdevās iegūt pasūtījumu", "details": str(e)}), 500
@@ -501,10 +1882,15 @@ def accept_order(current_user, order_id):
                 }), 400
 
         # Atjauninām materiālu daudzumus un versijas
+        consumption = []
         for order_material in order.materials:
             material = Material.query.get(order_material.material_id)
             material.daudzums -= order_material.quantity
             material.version += 1
+            order_material.material_version = material.version
+            record_stock_movement(material.id, -order_material.quantity, 'order_accept', current_user, order.id)
+            consumption.append((material.id, material.noliktava, order_material.quantity))
+        record_consumption(consumption)
 
         # Atjauninām pasūtījuma statusu
         order.status = 'accepted'
@@ -561,9 +1947,11 @@ def finish_order(current_user, order_id):
 
 @app.route("/employees", methods=["GET"])
 @token_required
+@read_replica
+@cached('employees')
 def get_employees(current_user):
     try:
-        employees = Employee.query.all()
+        employees = list_query('workers', request.args).all()
         employees_list = [{
             "id": employee.id,
             "vards": employee.vards,
@@ -573,6 +1961,8 @@ def get_employees(current_user):
             "status": employee.status
         } for employee in employees]
         return jsonify({"success": True, "employees": employees_list}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error fetching employees: {str(e)}")
         return jsonify({"error": "Failed to fetch employees", "details": str(e)}), 500
@@ -680,16 +2070,24 @@ def update_order(current_user, order_id):
 
             # Atjauninām materiālus
             # Vispirms atgriežam vecos daudzumus
+            consumption = []
             for order_material in order.materials:
                 material = Material.query.get(order_material.material_id)
                 material.daudzums += order_material.quantity
                 material.version += 1
+                record_stock_movement(material.id, order_material.quantity, 'order_update', current_user, order.id)
+                consumption.append((material.id, material.noliktava, -order_material.quantity))
 
             # Izdzēšam vecos materiālus
             OrderMaterial.query.filter_by(order_id=order.id).delete()
 
             # Pievienojam jaunos materiālus
             for material_data in materials_data:
+                # Atjauninām materiāla daudzumu un versiju
+                material_data['material'].daudzums -= material_data['quantity']
+                material_data['material'].version += 1
+
+                # Saitē glabājam versiju pēc rezervēšanas, pret to pārbauda apstiprināšana
                 order_material = OrderMaterial(
                     order_id=order.id,
                     material_id=material_data['material'].id,
@@ -697,10 +2095,12 @@ def update_order(current_user, order_id):
                     material_version=material_data['material'].version
                 )
                 db.session.add(order_material)
-                
-                # Atjauninām materiāla daudzumu un versiju
-                material_data['material'].daudzums -= material_data['quantity']
-                material_data['material'].version += 1
+                record_stock_movement(material_data['material'].id, -material_data['quantity'], 'order_update', current_user, order.id)
+                consumption.append((material_data['material'].id, material_data['material'].noliktava, material_data['quantity']))
+
+            # Pieņemtam pasūtījumam izmaiņas ieskaitām pieņemšanas periodā
+            if order.status in CONSUMED_STATUSES:
+                record_consumption(consumption, acceptance_times([order.id]).get(order.id))
 
         # Atjauninām pārējos pasūtījuma datus
         if 'nosaukums' in data:
@@ -741,16 +2141,23 @@ def create_material(current_user):
         if float(data['daudzums']) < 0.01:
             return jsonify({'error': 'Daudzumam jābūt vismaz 0.01'}), 400
 
+        reorder_level = data.get('reorder_level')
+        if reorder_level is not None and float(reorder_level) < 0:
+            return jsonify({'error': 'Pasūtīšanas slieksnis nevar būt negatīvs'}), 400
+
         new_material = Material(
             nosaukums=data['nosaukums'],
             noliktava=data['noliktava'],
             vieta=data['vieta'],
             vieniba=data['vieniba'],
             daudzums=float(data['daudzums']),
+            reorder_level=float(reorder_level) if reorder_level is not None else None,
             version=1  # Inicializējam versiju
         )
 
         db.session.add(new_material)
+        db.session.flush()
+        record_stock_movement(new_material.id, new_material.daudzums, 'create', current_user)
         db.session.commit()
 
         return jsonify({
@@ -763,6 +2170,7 @@ def create_material(current_user):
                 'vieta': new_material.vieta,
                 'vieniba': new_material.vieniba,
                 'daudzums': new_material.daudzums,
+                'reorder_level': new_material.reorder_level,
                 'version': new_material.version
             }
         }), 201
@@ -788,10 +2196,22 @@ def update_material(current_user, material_id):
                 "error": f'Materiāla "{material.nosaukums}" dati ir mainījušies. Lūdzu, atsvaidziniet lapu un mēģiniet vēlreiz.'
             }), 409
 
+        # Pasūtīšanas slieksnis nonāk daļējā indeksā, tāpēc to pārbaudām tāpat kā izveidē
+        if 'reorder_level' in data and data['reorder_level'] is not None:
+            try:
+                data['reorder_level'] = float(data['reorder_level'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Nederīgs pasūtīšanas slieksnis'}), 400
+            if data['reorder_level'] < 0:
+                return jsonify({'error': 'Pasūtīšanas slieksnis nevar būt negatīvs'}), 400
+
         # Atjauninām materiāla datus
+        old_daudzums = material.daudzums
         for key, value in data.items():
             if key != 'version' and hasattr(material, key):
                 setattr(material, key, value)
+        if material.daudzums != old_daudzums:
+            record_stock_movement(material.id, float(material.daudzums or 0) - float(old_daudzums or 0), 'adjust', current_user)
         
         # Palielinām versiju
         material.version += 1
@@ -815,6 +2235,7 @@ def delete_material(current_user, material_id):
         material = Material.query.get(material_id)
         if not material:
             return jsonify({"error": "Materiāls nav atrasts"}), 404
+        record_stock_movement(material.id, -(material.daudzums or 0), 'delete', current_user)
         db.session.delete(material)
         db.session.commit()
         return jsonify({"success": True, "message": "Materiāls izdzēsts"}), 200
@@ -871,6 +2292,11 @@ def create_order(current_user):
 
         # Pievienojam materiālus pasūtījumam
         for material_data in materials_data:
+            # Atjauninām materiāla daudzumu un versiju
+            material_data['material'].daudzums -= material_data['quantity']
+            material_data['material'].version += 1
+
+            # Saitē glabājam versiju pēc rezervēšanas, pret to pārbauda apstiprināšana
             order_material = OrderMaterial(
                 order_id=order.id,
                 material_id=material_data['material'].id,
@@ -878,10 +2304,7 @@ def create_order(current_user):
                 material_version=material_data['material'].version
             )
             db.session.add(order_material)
-            
-            # Atjauninām materiāla daudzumu un versiju
-            material_data['material'].daudzums -= material_data['quantity']
-            material_data['material'].version += 1
+            record_stock_movement(material_data['material'].id, -material_data['quantity'], 'order_create', current_user, order.id)
 
         db.session.commit()
 
@@ -906,11 +2329,16 @@ def delete_order(current_user, order_id):
             return jsonify({'error': 'Pasūtījums nav atrasts'}), 404
 
         # Atgriežam materiālu daudzumus
+        consumption = []
         for order_material in order.materials:
             material = Material.query.get(order_material.material_id)
             if material:
                 material.daudzums += order_material.quantity
                 material.version += 1
+                record_stock_movement(material.id, order_material.quantity, 'order_delete', current_user, order.id)
+                consumption.append((material.id, material.noliktava, -order_material.quantity))
+        if order.status in CONSUMED_STATUSES:
+            record_consumption(consumption, acceptance_times([order.id]).get(order.id))
 
         # Izdzēšam pasūtījumu
         db.session.delete(order)
@@ -986,6 +2414,231 @@ def end_shift(current_user, shift_id):
         logging.error(f"Kļūda beidzot maiņu: {str(e)}")
         return jsonify({"error": "Servera kļūda"}), 500
 
+# Vienots pilnteksta meklēšanas indekss pasūtījumiem, materiāliem un darbiniekiem
+SEARCH_TYPES = {
+    # tips: (modelis, indeksētie lauki)
+    'order': (Order, ('nosaukums',)),
+    'material': (Material, ('nosaukums', 'noliktava', 'vieta')),
+    'employee': (Employee, ('vards', 'uzvards', 'amats')),
+}
+search_index_state = {'available': False, 'checked_at': None}
+
+
+def search_document(entity_type, obj):
+    if entity_type == 'order':
+        return obj.nosaukums or '', ''
+    if entity_type == 'material':
+        return obj.nosaukums or '', f"{obj.noliktava or ''} {obj.vieta or ''}".strip()
+    return f"{obj.vards or ''} {obj.uzvards or ''}".strip(), obj.amats or ''
+
+
+def create_search_index(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(db.text("""
+            CREATE TABLE IF NOT EXISTS search_documents (
+                entity_type VARCHAR(10) NOT NULL,
+                entity_id INTEGER NOT NULL,
+                title TEXT,
+                body TEXT,
+                document tsvector GENERATED ALWAYS AS (
+                    setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+                ) STORED,
+                PRIMARY KEY (entity_type, entity_id)
+            )
+        """))
+        connection.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS search_documents_document_idx ON search_documents USING GIN (document)"
+        ))
+    else:
+        connection.execute(db.text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_documents USING fts5(
+                entity_type UNINDEXED, entity_id UNINDEXED, title, body,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """))
+
+
+def rebuild_search_index(connection):
+    connection.execute(db.text("DELETE FROM search_documents"))
+    connection.execute(db.text("""
+        INSERT INTO search_documents (entity_type, entity_id, title, body)
+        SELECT 'order', id, coalesce(nosaukums, ''), '' FROM orders
+        UNION ALL
+        SELECT 'material', id, coalesce(nosaukums, ''), trim(coalesce(noliktava, '') || ' ' || coalesce(vieta, '')) FROM materials
+        UNION ALL
+        SELECT 'employee', id, trim(coalesce(vards, '') || ' ' || coalesce(uzvards, '')), coalesce(amats, '') FROM employees
+    """))
+
+
+def search_index_available(connection):
+    # Ja indeksa vēl nav, pārbaudām atkārtoti ik minūti (to var izveidot cits process)
+    now = time.monotonic()
+    if not search_index_state['available'] and (
+        search_index_state['checked_at'] is None or now - search_index_state['checked_at'] > 60
+    ):
+        search_index_state['available'] = db.inspect(connection).has_table('search_documents')
+        search_index_state['checked_at'] = now
+    return search_index_state['available']
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def update_search_index(session, flush_context):
+    changed = []
+    removed = []
+    for obj in list(session.new) + list(session.dirty):
+        for entity_type, (model, fields) in SEARCH_TYPES.items():
+            if isinstance(obj, model):
+                state = db.inspect(obj)
+                if obj in session.new or any(state.attrs[field].history.has_changes() for field in fields):
+                    title, body = search_document(entity_type, obj)
+                    changed.append({'entity_type': entity_type, 'entity_id': obj.id, 'title': title, 'body': body})
+    for obj in session.deleted:
+        for entity_type, (model, _) in SEARCH_TYPES.items():
+            if isinstance(obj, model):
+                removed.append({'entity_type': entity_type, 'entity_id': obj.id})
+
+    if not changed and not removed:
+        return
+    connection = session.connection()
+    if not search_index_available(connection):
+        return
+
+    # Indekss tiek atjaunināts tajā pašā transakcijā, kurā mainās dati
+    if connection.dialect.name == 'postgresql':
+        if changed:
+            connection.execute(db.text("""
+                INSERT INTO search_documents (entity_type, entity_id, title, body)
+                VALUES (:entity_type, :entity_id, :title, :body)
+                ON CONFLICT (entity_type, entity_id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body
+            """), changed)
+    else:
+        removed = removed + [{'entity_type': row['entity_type'], 'entity_id': row['entity_id']} for row in changed]
+    if removed:
+        connection.execute(db.text(
+            "DELETE FROM search_documents WHERE entity_type = :entity_type AND entity_id = :entity_id"
+        ), removed)
+    if changed and connection.dialect.name != 'postgresql':
+        connection.execute(db.text("""
+            INSERT INTO search_documents (entity_type, entity_id, title, body)
+            VALUES (:entity_type, :entity_id, :title, :body)
+        """), changed)
+
+
+def search_documents(terms, types, limit, offset):
+    params = {'types': types, 'limit': limit, 'offset': offset}
+    if db.engine.dialect.name == 'postgresql':
+        params['query'] = ' & '.join(f'{term}:*' for term in terms)
+        sql = """
+            SELECT entity_type, entity_id, title, body, ts_rank(document, query) AS rank
+            FROM search_documents, to_tsquery('simple', :query) AS query
+            WHERE document @@ query AND entity_type IN :types
+            ORDER BY rank DESC, entity_type, entity_id
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        params['query'] = ' '.join(f'"{term}"*' for term in terms)
+        sql = """
+            SELECT entity_type, entity_id, title, body, -bm25(search_documents, 0, 0, 10.0, 5.0) AS rank
+            FROM search_documents
+            WHERE search_documents MATCH :query AND entity_type IN :types
+            ORDER BY rank DESC, entity_type, entity_id
+            LIMIT :limit OFFSET :offset
+        """
+    statement = db.text(sql).bindparams(db.bindparam('types', expanding=True))
+    return db.session.execute(statement, params).all()
+
+
+SearchRow = namedtuple('SearchRow', 'entity_type entity_id title body rank')
+
+
+def search_without_index(terms, types, limit, offset):
+    # Kamēr indekss nav izveidots, meklējam ar LIKE tajos pašos laukos, bez ranga
+    rows = []
+    for entity_type in types:
+        model, fields = SEARCH_TYPES[entity_type]
+        query = model.query.filter(*[
+            db.or_(*[getattr(model, field).icontains(term, autoescape=True) for field in fields])
+            for term in terms
+        ]).order_by(model.id).limit(offset + limit)
+        rows.extend(SearchRow(entity_type, obj.id, *search_document(entity_type, obj), 0) for obj in query)
+    rows.sort(key=lambda row: (row.entity_type, row.entity_id))
+    return rows[offset:offset + limit]
+
+
+def ensure_search_index():
+    # Pēc izvietošanas vai migrācijas indeksu izveidojam paši, nevis gaidām POST /api/search/reindex
+    connection = db.session.connection()
+    if search_index_available(connection):
+        return
+    try:
+        create_search_index(connection)
+        rebuild_search_index(connection)
+        db.session.commit()
+        search_index_state['available'] = True
+    except Exception as e:
+        # Visticamāk to vienlaikus veido cits process
+        db.session.rollback()
+        logging.warning(f"Search index build skipped: {str(e)}")
+
+
+@app.route('/api/search', methods=['GET'])
+@token_required
+@read_replica
+def unified_search(current_user):
+    try:
+        terms = re.findall(r'\w+', request.args.get('q', '').lower())
+        if not terms:
+            return jsonify({"error": "Trūkst meklēšanas teksta"}), 400
+
+        types = [t for t in request.args.get('types', ','.join(SEARCH_TYPES)).split(',') if t]
+        unknown = set(types) - SEARCH_TYPES.keys()
+        if unknown or not types:
+            return jsonify({"error": f'Nederīgs tips, atļauts: {", ".join(SEARCH_TYPES)}'}), 400
+
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        offset = max(0, request.args.get('offset', 0, type=int))
+
+        # Paņemam vienu ierakstu vairāk, lai zinātu, vai ir nākamā lapa
+        if search_index_available(db.session.connection()):
+            rows = search_documents(terms, types, limit + 1, offset)
+        else:
+            rows = search_without_index(terms, types, limit + 1, offset)
+        return jsonify({
+            "results": [{
+                "type": row.entity_type,
+                "id": int(row.entity_id),
+                "title": row.title,
+                "subtitle": row.body,
+                "rank": round(float(row.rank), 6)
+            } for row in rows[:limit]],
+            "limit": limit,
+            "offset": offset,
+            "has_more": len(rows) > limit
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Search error: {str(e)}")
+        return jsonify({"error": "Meklēšana neizdevās", "details": str(e)}), 500
+
+
+@app.route('/api/search/reindex', methods=['POST'])
+@token_required
+def reindex_search(current_user):
+    try:
+        connection = db.session.connection()
+        create_search_index(connection)
+        rebuild_search_index(connection)
+        db.session.commit()
+        search_index_state['available'] = True
+        return jsonify({"success": True, "message": "Meklēšanas indekss pārbūvēts"}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Search reindex error: {str(e)}")
+        return jsonify({"error": "Neizdevās pārbūvēt meklēšanas indeksu", "details": str(e)}), 500
+
+
 @app.route('/materials/search')
 def search_materials():
     search_term = request.args.get('q', '')
@@ -1021,20 +2674,337 @@ def download_font(url, save_path):
     else:
         raise Exception(f"Failed to download font: {response.status_code}")
 
-def create_pdf_content(report_type, data):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
+# Algu aprēķins no maiņu vēstures (virsstundas, nakts stundas, pārklājumi)
+app.config['PAYROLL_DAILY_LIMIT'] = float(os.getenv('PAYROLL_DAILY_LIMIT', 8))
+app.config['PAYROLL_WEEKLY_LIMIT'] = float(os.getenv('PAYROLL_WEEKLY_LIMIT', 40))
+app.config['PAYROLL_NIGHT_START'] = float(os.getenv('PAYROLL_NIGHT_START', 22))
+app.config['PAYROLL_NIGHT_END'] = float(os.getenv('PAYROLL_NIGHT_END', 6))
+app.config['PAYROLL_TIMEZONE'] = os.getenv('PAYROLL_TIMEZONE', 'Europe/Riga')
+
+
+def epoch_expr(column):
+    if db.engine.dialect.name == 'postgresql':
+        return func.extract('epoch', column)
+    return (func.julianday(column) - 2440587.5) * 86400
+
+
+def payroll_timezone():
+    try:
+        return ZoneInfo(app.config['PAYROLL_TIMEZONE'])
+    except Exception:
+        logging.warning(f"Unknown payroll timezone {app.config['PAYROLL_TIMEZONE']}, using UTC")
+        return datetime.timezone.utc
+
+
+def local_offsets(utc_seconds, tz):
+    # Laika nobīde mainās tikai pilnās stundās, tādēļ to aprēķinām katrai unikālajai stundai
+    hours, inverse = np.unique(utc_seconds // 3600, return_inverse=True)
+    offsets = np.array([
+        datetime.datetime.fromtimestamp(hour * 3600, tz).utcoffset().total_seconds()
+        for hour in hours.tolist()
+    ], dtype=np.int64)
+    return offsets[inverse]
+
+
+def night_seconds_before(local_seconds, night_start, night_end):
+    # Nakts sekundes no epohas sākuma līdz dotajam brīdim
+    days, rest = np.divmod(local_seconds, 86400)
+    start = int(night_start * 3600)
+    end = int(night_end * 3600)
+    if start > end:
+        per_day = 86400 - start + end
+        partial = np.minimum(rest, end) + np.maximum(rest - start, 0)
+    else:
+        per_day = end - start
+        partial = np.clip(rest - start, 0, per_day)
+    return days * per_day + partial
+
+
+def group_sums(keys, weights):
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, inverse, np.bincount(inverse, weights=weights)
+
+
+def compute_payroll(args):
+    query = db.session.query(
+        Shift.id, Shift.employee_id, epoch_expr(Shift.start_time), epoch_expr(Shift.end_time)
+    ).filter(
+        Shift.employee_id.isnot(None),
+        Shift.start_time.isnot(None),
+        Shift.end_time.isnot(None)
+    )
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    if start_date:
+        query = query.filter(Shift.start_time >= parser.parse(start_date))
+    if end_date:
+        query = query.filter(Shift.end_time <= parser.parse(end_date))
+    employee_id = args.get('employee_id', type=int)
+    if employee_id:
+        query = query.filter(Shift.employee_id == employee_id)
+
+    rows = query.all()
+    if not rows:
+        return []
+
+    data = np.array(rows, dtype=np.float64)
+    shift_ids = data[:, 0].astype(np.int64)
+    start = np.rint(data[:, 2]).astype(np.int64)
+    end = np.maximum(np.rint(data[:, 3]).astype(np.int64), start)
+    employee_ids, employee = np.unique(data[:, 1].astype(np.int64), return_inverse=True)
+
+    order = np.lexsort((start, employee))
+    shift_ids, employee, start, end = shift_ids[order], employee[order], start[order], end[order]
+
+    # Pārklājumi: katra darbinieka grupu nobīdām tā, lai kumulatīvais maksimums nepārietu starp grupām
+    base = start.min()
+    span = end.max() - base + 1
+    start_key = start - base + employee * span
+    end_key = end - base + employee * span
+    running_end = np.maximum.accumulate(end_key)
+    previous_end = np.concatenate(([-1], running_end[:-1]))
+    holder = np.maximum.accumulate(np.where(end_key == running_end, np.arange(len(end_key)), 0))
+    previous_holder = np.concatenate(([0], holder[:-1]))
+    overlaps = start_key < previous_end
+
+    # Pārklāto daļu neskaitām divreiz
+    effective_start = np.where(overlaps, np.minimum(previous_end - employee * span + base, end), start)
+    worked = (end - effective_start) / 3600
+    overlap = (effective_start - start) / 3600
+
+    tz = payroll_timezone()
+    local_start = effective_start + local_offsets(effective_start, tz)
+    local_end = end + local_offsets(end, tz)
+    night_start = app.config['PAYROLL_NIGHT_START']
+    night_end = app.config['PAYROLL_NIGHT_END']
+    night = np.clip(
+        (night_seconds_before(local_end, night_start, night_end) - night_seconds_before(local_start, night_start, night_end)) / 3600,
+        0, worked
     )
 
-    
-    font_path = os.path.join(os.path.dirname(__file__), 'fonts', 'DejaVuSans.ttf')
-    pdfmetrics.registerFont(TTFont('DejaVuSans', font_path))
+    # Maiņa pieder dienai, kurā tā sākās; nedēļas sākas pirmdienā (1970-01-01 bija ceturtdiena)
+    day = local_start // 86400
+    day_width = day.max() - day.min() + 1
+    day_keys, _, daily_hours = group_sums(employee * day_width + (day - day.min()), worked)
+    daily_employee = day_keys // day_width
+    daily_regular = np.minimum(daily_hours, app.config['PAYROLL_DAILY_LIMIT'])
+    daily_overtime = daily_hours - daily_regular
+
+    week = (day_keys % day_width + day.min() + 3) // 7
+    week_width = week.max() - week.min() + 1
+    week_keys, _, weekly_regular = group_sums(daily_employee * week_width + (week - week.min()), daily_regular)
+    weekly_overtime = np.maximum(weekly_regular - app.config['PAYROLL_WEEKLY_LIMIT'], 0)
+
+    count = len(employee_ids)
+    hours = np.bincount(employee, weights=worked, minlength=count)
+    daily_ot = np.bincount(daily_employee, weights=daily_overtime, minlength=count)
+    weekly_ot = np.bincount(week_keys // week_width, weights=weekly_overtime, minlength=count)
+    night_hours = np.bincount(employee, weights=night, minlength=count)
+    overlap_hours = np.bincount(employee, weights=overlap, minlength=count)
+    shift_counts = np.bincount(employee, minlength=count)
+
+    overlapping = {}
+    for index in np.flatnonzero(overlaps).tolist():
+        overlapping.setdefault(int(employee[index]), []).append({
+            'shift_id': int(shift_ids[index]),
+            'overlaps_with': int(shift_ids[previous_holder[index]]),
+            'hours': round(float(overlap[index]), 2)
+        })
+
+    names = {
+        row.id: row
+        for row in db.session.query(Employee.id, Employee.vards, Employee.uzvards, Employee.amats)
+        .filter(Employee.id.in_(employee_ids.tolist())).all()
+    }
+    result = []
+    for index, employee_id in enumerate(employee_ids.tolist()):
+        person = names.get(employee_id)
+        overtime = daily_ot[index] + weekly_ot[index]
+        result.append({
+            'id': employee_id,
+            'vards': person.vards if person else None,
+            'uzvards': person.uzvards if person else None,
+            'amats': person.amats if person else None,
+            'shifts': int(shift_counts[index]),
+            'hours': round(float(hours[index]), 2),
+            'regular_hours': round(float(hours[index] - overtime), 2),
+            'overtime_daily': round(float(daily_ot[index]), 2),
+            'overtime_weekly': round(float(weekly_ot[index]), 2),
+            'overtime_hours': round(float(overtime), 2),
+            'night_hours': round(float(night_hours[index]), 2),
+            'overlap_hours': round(float(overlap_hours[index]), 2),
+            'overlaps': overlapping.get(index, [])
+        })
+    result.sort(key=lambda row: ((row['vards'] or '').lower(), (row['uzvards'] or '').lower(), row['id']))
+    return result
+
+
+@app.route("/api/payroll", methods=["GET"])
+@token_required
+@read_replica
+@coalesce()
+@admission('report')
+def get_payroll(current_user):
+    try:
+        return jsonify({
+            'settings': {
+                'daily_limit': app.config['PAYROLL_DAILY_LIMIT'],
+                'weekly_limit': app.config['PAYROLL_WEEKLY_LIMIT'],
+                'night_start': app.config['PAYROLL_NIGHT_START'],
+                'night_end': app.config['PAYROLL_NIGHT_END'],
+                'timezone': app.config['PAYROLL_TIMEZONE']
+            },
+            'employees': compute_payroll(request.args)
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error computing payroll: {str(e)}")
+        return jsonify({"error": "Neizdevās aprēķināt darba samaksas datus", "details": str(e)}), 500
+
+
+# Lielas atskaites: rindas tiek lasītas porcijās un tabula veidota fiksēta izmēra daļās
+app.config['REPORT_TABLE_CHUNK'] = int(os.getenv('REPORT_TABLE_CHUNK', 500))
+app.config['REPORT_FETCH_BATCH'] = int(os.getenv('REPORT_FETCH_BATCH', 1000))
+app.config['EXPORT_SPOOL_SIZE'] = int(os.getenv('EXPORT_SPOOL_SIZE', 16 * 1024 * 1024))
+
+REPORT_TITLES = {
+    'orders': 'Pasūtījumu Atskaite',
+    'materials': 'Materiālu Atskaite',
+    'workers': 'Darbinieku Atskaite',
+    'shifts': 'Maiņu Atskaite',
+    'payroll': 'Darba Laika Uzskaites Atskaite'
+}
+
+# Kolonnas: (virsraksts, vērtība no rindas)
+REPORT_TABLES = {
+    'orders': {
+        'columns': [
+            ('Nosaukums', lambda row: row.get('nosaukums', '')),
+            ('Daudzums', lambda row: str(row.get('daudzums', ''))),
+            ('Statuss', lambda row: row.get('status', '')),
+        ],
+        'widths': [8*cm, 3*cm, 3*cm],
+        'empty': "Nav pasūtījumu datu"
+    },
+    'materials': {
+        'columns': [
+            ('Nosaukums', lambda row: row.get('nosaukums', '')),
+            ('Daudzums', lambda row: str(row.get('daudzums', ''))),
+            ('Vienība', lambda row: row.get('vieniba', '')),
+            ('Noliktava', lambda row: row.get('noliktava', '')),
+        ],
+        'widths': [7*cm, 3*cm, 2*cm, 4*cm],
+        'empty': "Nav materiālu datu"
+    },
+    'workers': {
+        'columns': [
+            ('Vārds', lambda row: row.get('vards', '')),
+            ('Uzvārds', lambda row: row.get('uzvards', '')),
+            ('Amats', lambda row: row.get('amats', '')),
+            ('Statuss', lambda row: row.get('status', '')),
+        ],
+        'widths': [4*cm, 4*cm, 5*cm, 3*cm],
+        'empty': "Nav darbinieku datu"
+    },
+    'shifts': {
+        'columns': [
+            ('Vārds', lambda row: row.get('vards', '')),
+            ('Uzvārds', lambda row: row.get('uzvards', '')),
+            ('Amats', lambda row: row.get('amats', '')),
+            ('Stundas', lambda row: str(row.get('hours', ''))),
+        ],
+        'widths': [4*cm, 4*cm, 5*cm, 3*cm],
+        'empty': "Nav maiņu datu"
+    },
+    'payroll': {
+        'columns': [
+            ('Vārds', lambda row: row.get('vards', '')),
+            ('Uzvārds', lambda row: row.get('uzvards', '')),
+            ('Stundas', lambda row: str(row.get('hours', ''))),
+            ('Virsstundas', lambda row: str(row.get('overtime_hours', ''))),
+            ('Nakts', lambda row: str(row.get('night_hours', ''))),
+            ('Pārklāj.', lambda row: str(len(row.get('overlaps', [])))),
+        ],
+        'widths': [3.5*cm, 3.5*cm, 2.5*cm, 2.5*cm, 2.5*cm, 2.5*cm],
+        'empty': "Nav darba laika datu"
+    },
+}
+
+REPORT_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('PADDING', (0, 0), (-1, -1), 6),
+])
+
+
+def register_report_fonts():
+    # TTF fonta parsēšana ir dārga, tādēļ to darām tikai vienreiz procesā
+    if 'DejaVuSans' not in pdfmetrics.getRegisteredFontNames():
+        font_path = os.path.join(os.path.dirname(__file__), 'fonts', 'DejaVuSans.ttf')
+        pdfmetrics.registerFont(TTFont('DejaVuSans', font_path))
+
+
+def layout_flowables(canv, flowables, new_frame):
+    # Izkārtojam ar Frame.add/Frame.split; nākamo elementu veidojam tikai tad, kad iepriekšējais ir izvietots
+    frame, placed = new_frame(), False
+    for flowable in flowables:
+        pending = [flowable]
+        while pending:
+            head = pending.pop(0)
+            if frame.add(head, canv):
+                placed = True
+                continue
+            # Tabula tiek sadalīta pa lapām, virsraksta rinda atkārtojas (repeatRows)
+            parts = frame.split(head, canv)
+            if parts and parts[0] is not head and frame.add(parts[0], canv):
+                placed = True
+                pending[:0] = parts[1:]
+                continue
+            if not placed:
+                raise ValueError('Atskaites elements neietilpst lapā')
+            canv.showPage()
+            frame, placed = new_frame(), False
+            pending.insert(0, head)
+    canv.showPage()
+
+
+def report_flowables(report_type, rows, styles):
+    yield Paragraph(REPORT_TITLES.get(report_type, 'Atskaite'), styles['LatvianTitle'])
+    yield Spacer(1, 20)
+
+    spec = REPORT_TABLES.get(report_type)
+    if not spec:
+        return
+
+    # Katrai daļai sava virsraksta rinda, kas atkārtojas arī, ja daļa pāriet uz nākamo lapu
+    header = [title for title, _ in spec['columns']]
+    chunk = [header]
+    has_rows = False
+    for row in rows:
+        chunk.append([value(row) for _, value in spec['columns']])
+        has_rows = True
+        if len(chunk) > app.config['REPORT_TABLE_CHUNK']:
+            yield Table(chunk, colWidths=spec['widths'], repeatRows=1, style=REPORT_TABLE_STYLE)
+            chunk = [header]
+    if len(chunk) > 1:
+        yield Table(chunk, colWidths=spec['widths'], repeatRows=1, style=REPORT_TABLE_STYLE)
+    elif not has_rows:
+        yield Paragraph(spec['empty'], styles['Latvian'])
+
+
+def create_pdf_content(report_type, data, output=None):
+    # data var būt jebkurš iterators; rezultāts tiek rakstīts pagaidu failā, kas lieliem PDF pāriet uz disku.
+    # Rindas un tabulas atmiņā netiek turētas, taču kanva līdz save() glabā visu jau uzzīmēto lapu saturu,
+    # tādēļ atmiņa nav ierobežota: tā aug ar lapu skaitu, mērot ~0,45 MB uz 1000 tabulas rindām (~27 lapām)
+    output = output or tempfile.SpooledTemporaryFile(max_size=app.config['EXPORT_SPOOL_SIZE'])
+    width, height = A4
+    canv = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+
+    register_report_fonts()
 
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(
@@ -1050,119 +3020,71 @@ def create_pdf_content(report_type, data):
         leading=18,
         spaceAfter=30
     ))
-    
-    content = []
-    
-    
-    titles = {
-        'orders': 'Pasūtījumu Atskaite',
-        'materials': 'Materiālu Atskaite',
-        'workers': 'Darbinieku Atskaite',
-        'shifts': 'Maiņu Atskaite'
-    }
-    
-    content.append(Paragraph(titles.get(report_type, 'Atskaite'), styles['LatvianTitle']))
-    content.append(Spacer(1, 20))
-    
-    
+
+    layout_flowables(
+        canv,
+        report_flowables(report_type, data, styles),
+        lambda: Frame(2*cm, 2*cm, width - 4*cm, height - 4*cm)
+    )
+    canv.save()
+    output.seek(0)
+    return output
+
+
+def send_spooled(spool, download_name, mimetype):
+    size = spool.seek(0, os.SEEK_END)
+    spool.seek(0)
+    response = send_file(spool, as_attachment=True, download_name=download_name, mimetype=mimetype)
+    response.content_length = size
+    return response
+
+REPORT_DEFAULT_SORT = {
+    'orders': 'nosaukums',
+    'materials': 'nosaukums',
+    'workers': 'vards',
+    'shifts': 'vards',
+}
+
+
+def report_query(report_type, args):
+    # Tikai izveido vaicājumu (kļūdaini parametri -> ValueError), datubāzē neko neizpilda
+    default_sort = REPORT_DEFAULT_SORT.get(report_type)
     if report_type == 'orders':
-        if data:
-            table_data = [['Nosaukums', 'Daudzums', 'Statuss']]
-            for order in data:
-                table_data.append([
-                    order.get('nosaukums', ''),
-                    str(order.get('daudzums', '')),
-                    order.get('status', '')
-                ])
-            table = Table(table_data, colWidths=[8*cm, 3*cm, 3*cm])
-            table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('PADDING', (0, 0), (-1, -1), 6),
-            ]))
-            content.append(table)
-        else:
-            content.append(Paragraph("Nav pasūtījumu datu", styles['Latvian']))
-            
-    elif report_type == 'materials':
-        if data:
-            table_data = [['Nosaukums', 'Daudzums', 'Vienība', 'Noliktava']]
-            for material in data:
-                table_data.append([
-                    material.get('nosaukums', ''),
-                    str(material.get('daudzums', '')),
-                    material.get('vieniba', ''),
-                    material.get('noliktava', '')
-                ])
-            table = Table(table_data, colWidths=[7*cm, 3*cm, 2*cm, 4*cm])
-            table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('PADDING', (0, 0), (-1, -1), 6),
-            ]))
-            content.append(table)
-        else:
-            content.append(Paragraph("Nav materiālu datu", styles['Latvian']))
-            
-    elif report_type == 'workers':
-        if data:
-            table_data = [['Vārds', 'Uzvārds', 'Amats', 'Statuss']]
-            for worker in data:
-                table_data.append([
-                    worker.get('vards', ''),
-                    worker.get('uzvards', ''),
-                    worker.get('amats', ''),
-                    worker.get('status', '')
-                ])
-            table = Table(table_data, colWidths=[4*cm, 4*cm, 5*cm, 3*cm])
-            table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('PADDING', (0, 0), (-1, -1), 6),
-            ]))
-            content.append(table)
-        else:
-            content.append(Paragraph("Nav darbinieku datu", styles['Latvian']))
-            
-    elif report_type == 'shifts':
-        if data:
-            table_data = [['Vārds', 'Uzvārds', 'Amats', 'Stundas']]
-            for shift in data:
-                table_data.append([
-                    shift.get('vards', ''),
-                    shift.get('uzvards', ''),
-                    shift.get('amats', ''),
-                    str(shift.get('hours', ''))
-                ])
-            table = Table(table_data, colWidths=[4*cm, 4*cm, 5*cm, 3*cm])
-            table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('PADDING', (0, 0), (-1, -1), 6),
-            ]))
-            content.append(table)
-        else:
-            content.append(Paragraph("Nav maiņu datu", styles['Latvian']))
-    
-    doc.build(content)
-    buffer.seek(0)
-    return buffer
+        return list_query('orders', args, default_sort).with_entities(
+            Order.nosaukums, Order.daudzums, Order.status
+        )
+    if report_type == 'materials':
+        return list_query('materials', args, default_sort).with_entities(
+            Material.nosaukums, Material.daudzums, Material.vieniba, Material.noliktava
+        )
+    if report_type == 'workers':
+        return list_query('workers', args, default_sort).with_entities(
+            Employee.vards, Employee.uzvards, Employee.amats, Employee.status
+        )
+    if report_type == 'shifts':
+        return shift_totals_query(args, default_sort)
+    return None
+
+
+def check_report_args(report_type, args):
+    report_query(report_type, args)
+    for key in ('start_date', 'end_date'):
+        if args.get(key):
+            parser.parse(args[key])
+
+
+def report_rows(report_type, args):
+    # Rindas tiek lasītas porcijās
+    if report_type == 'payroll':
+        return compute_payroll(args)
+    query = report_query(report_type, args)
+    if query is None:
+        return []
+    rows = (dict(row._mapping) for row in query.yield_per(app.config['REPORT_FETCH_BATCH']))
+    if report_type == 'shifts':
+        return ({**row, 'hours': round(float(row['hours']), 2)} for row in rows)
+    return rows
+
 
 @app.route('/api/export_pdf', methods=['OPTIONS'])
 def export_pdf_options():
@@ -1174,105 +3096,16 @@ def export_pdf_options():
 
 @app.route('/api/export_pdf', methods=['GET'])
 @token_required
+@read_replica
+@admission('export')
 def export_pdf(current_user):
     try:
         report_type = request.args.get('type', 'shifts')
-        sort_by = request.args.get('sort_by')
-        sort_order = request.args.get('sort_order', 'asc')
-        search = request.args.get('search', '').lower()
-        
-        if not sort_by:
-            if report_type == 'orders':
-                sort_by = 'nosaukums'
-            elif report_type == 'materials':
-                sort_by = 'nosaukums'
-            elif report_type == 'workers':
-                sort_by = 'vards'
-            elif report_type == 'shifts':
-                sort_by = 'vards'
-            else:
-                sort_by = None
-        
-        data = []
+
         try:
-            if report_type == 'orders':
-                # Iegūstam pasūtījumus
-                orders = Order.query.all()
-                data = [{
-                    'nosaukums': order.nosaukums,
-                    'daudzums': order.daudzums,
-                    'status': order.status
-                } for order in orders]
-                
-                # Filtrējam pēc meklēšanas
-                if search:
-                    data = [x for x in data if search in x['nosaukums'].lower()]
-                
-            elif report_type == 'materials':
-                # Iegūstam materiālus
-                materials = Material.query.all()
-                data = [{
-                    'nosaukums': material.nosaukums,
-                    'daudzums': material.daudzums,
-                    'vieniba': material.vieniba,
-                    'noliktava': material.noliktava
-                } for material in materials]
-                
-                # Filtrējam pēc meklēšanas
-                if search:
-                    data = [x for x in data if search in x['nosaukums'].lower()]
-                
-            elif report_type == 'workers':
-                # Iegūstam darbiniekus
-                employees = Employee.query.all()
-                data = [{
-                    'vards': emp.vards,
-                    'uzvards': emp.uzvards,
-                    'amats': emp.amats,
-                    'status': emp.status
-                } for emp in employees]
-                
-                # Filtrējam pēc meklēšanas
-                if search:
-                    data = [x for x in data if search in f"{x['vards']} {x['uzvards']}".lower()]
-                
-            elif report_type == 'shifts':
-                # Iegūstam maiņu datus
-                start = request.args.get('start_date')
-                end = request.args.get('end_date')
-                start_date = parser.parse(start) if start else None
-                end_date = parser.parse(end) if end else None
-                
-                employees = Employee.query.options(joinedload(Employee.shifts)).all()
-                data = []
-                for emp in employees:
-                    total_hours = 0
-                    for shift in emp.shifts:
-                        if not shift.start_time or not shift.end_time:
-                            continue
-                        if start_date and shift.start_time < start_date:
-                            continue
-                        if end_date and shift.end_time > end_date:
-                            continue
-                        duration_hours = (shift.end_time - shift.start_time).total_seconds() / 3600
-                        total_hours += duration_hours
-                    if total_hours > 0:
-                        data.append({
-                            'vards': emp.vards,
-                            'uzvards': emp.uzvards,
-                            'amats': emp.amats,
-                            'hours': round(total_hours, 2)
-                        })
-                
-                # Filtrējam pēc meklēšanas
-                if search:
-                    data = [x for x in data if search in f"{x['vards']} {x['uzvards']}".lower()]
-            
-            # Kārtojam datus
-            if sort_by and data:
-                reverse = sort_order == 'desc'
-                data.sort(key=lambda x: x.get(sort_by, ''), reverse=reverse)
-                
+            data = report_rows(report_type, request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             logging.error(f"Error fetching data: {str(e)}")
             return jsonify({'error': 'Neizdevās iegūt datus'}), 500
@@ -1283,16 +3116,287 @@ def export_pdf(current_user):
             logging.error(f"Error generating PDF: {str(e)}")
             return jsonify({'error': 'Neizdevās ģenerēt PDF'}), 500
         
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f"{report_type}_atskaite.pdf",
-            mimetype='application/pdf'
-        )
+        return send_spooled(buffer, f"{report_type}_atskaite.pdf", 'application/pdf')
         
     except Exception as e:
         logging.error(f"Error in export_pdf: {str(e)}")
         return jsonify({'error': 'Servera kļūda'}), 500
+
+
+# Vairāku atskaišu ZIP pakete; PDF zīmēšana notiek procesu pūlā, jo ReportLab izkārtojums noslogo CPU
+app.config['EXPORT_POOL_SIZE'] = int(os.getenv('EXPORT_POOL_SIZE', min(4, os.cpu_count() or 1)))
+app.config['EXPORT_REPORT_TIMEOUT'] = float(os.getenv('EXPORT_REPORT_TIMEOUT', 60))
+app.config['EXPORT_POOL_START_METHOD'] = os.getenv(
+    'EXPORT_POOL_START_METHOD',
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+BUNDLE_REPORT_TYPES = ('orders', 'materials', 'workers', 'shifts', 'payroll')
+# Periods attiecas uz visām atskaitēm; kārtošanu un filtrus norāda katrai atsevišķi, piem. orders.sort_by=status
+BUNDLE_SHARED_ARGS = ('start_date', 'end_date')
+
+export_pool = {'executor': None}
+export_pool_lock = threading.Lock()
+
+
+def stop_render(signum, frame):
+    raise TimeoutError('pārsniegts laika limits')
+
+
+def render_report(report_type, args, use_replica=False, timeout=None):
+    # Izpildās pūla procesā: dati tiek lasīti šeit, lai galvenais process rindas netur atmiņā.
+    # Pagaidu failu nevar nodot atpakaļ, tādēļ atgriežam baitus
+    if timeout and hasattr(signal, 'setitimer'):
+        # Pēc taimauta atskaite pārtrauc sevi pati, un process atbrīvojas nākamajām
+        signal.signal(signal.SIGALRM, stop_render)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with app.test_request_context():
+            g.use_replica = use_replica
+            try:
+                with create_pdf_content(report_type, report_rows(report_type, args)) as output:
+                    return output.read()
+            finally:
+                db.session.remove()
+    finally:
+        if timeout and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def get_export_pool():
+    with export_pool_lock:
+        if export_pool['executor'] is None and app.config['EXPORT_POOL_SIZE'] > 0:
+            try:
+                export_pool['executor'] = ProcessPoolExecutor(
+                    max_workers=app.config['EXPORT_POOL_SIZE'],
+                    mp_context=multiprocessing.get_context(app.config['EXPORT_POOL_START_METHOD'])
+                )
+            except (OSError, ValueError, NotImplementedError) as e:
+                # Piemēram, serverless vidē bez /dev/shm
+                logging.warning(f"Process pool not available, rendering serially: {str(e)}")
+                app.config['EXPORT_POOL_SIZE'] = 0
+        return export_pool['executor']
+
+
+def discard_export_pool(executor):
+    # Salūzušā pūlā visi uzdevumi jau ir beigušies ar kļūdu; nākamais pieprasījums izveidos jaunu
+    with export_pool_lock:
+        if export_pool['executor'] is executor:
+            export_pool['executor'] = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def bundle_report_args(args, report_type):
+    scoped = MultiDict([(key, value) for key, value in args.items(multi=True) if key in BUNDLE_SHARED_ARGS])
+    prefix = f'{report_type}.'
+    for key in args.keys():
+        if key.startswith(prefix):
+            scoped.setlist(key[len(prefix):], args.getlist(key))
+    return scoped
+
+
+def render_reports(reports):
+    # reports: atskaites veids -> tās parametri
+    results = {}
+    errors = {}
+    executor = get_export_pool()
+    if executor is None:
+        for report_type, args in reports.items():
+            try:
+                with create_pdf_content(report_type, report_rows(report_type, args)) as output:
+                    results[report_type] = output.read()
+            except Exception as e:
+                errors[report_type] = str(e)
+        return results, errors
+
+    timeout = app.config['EXPORT_REPORT_TIMEOUT']
+    pool_size = app.config['EXPORT_POOL_SIZE']
+    use_replica = bool(g.get('use_replica'))
+    submitted = time.monotonic()
+    futures = []
+    try:
+        for index, (report_type, args) in enumerate(reports.items()):
+            # Rindā gaidošām atskaitēm termiņu pagarinām par laiku, kamēr tās vēl nevar sākt zīmēt
+            deadline = submitted + timeout * (index // pool_size + 1)
+            future = executor.submit(render_report, report_type, args, use_replica, timeout)
+            futures.append((report_type, future, deadline))
+    except BrokenProcessPool as e:
+        discard_export_pool(executor)
+        return results, {report_type: str(e) for report_type in reports}
+
+    broken = False
+    for report_type, future, deadline in futures:
+        try:
+            results[report_type] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except (FutureTimeoutError, TimeoutError):
+            # Rindā gaidošu atskaiti atceļam, zīmējošā pārtrauksies pati
+            future.cancel()
+            errors[report_type] = 'timeout'
+        except BrokenProcessPool as e:
+            errors[report_type] = str(e)
+            broken = True
+        except Exception as e:
+            errors[report_type] = str(e)
+    if broken:
+        discard_export_pool(executor)
+    return results, errors
+
+
+@app.route('/api/export_bundle', methods=['GET'])
+@token_required
+@read_replica
+@admission('export')
+def export_bundle(current_user):
+    try:
+        types = [t for t in request.args.get('types', ','.join(BUNDLE_REPORT_TYPES[:4])).split(',') if t]
+        invalid = [t for t in types if t not in BUNDLE_REPORT_TYPES]
+        if invalid or not types:
+            return jsonify({'error': f'Nederīgs atskaites veids, atļauts: {", ".join(BUNDLE_REPORT_TYPES)}'}), 400
+        types = list(dict.fromkeys(types))
+
+        # Pūls saņem tikai parametrus, dati tiek nolasīti zīmēšanas procesā
+        reports = {report_type: bundle_report_args(request.args, report_type) for report_type in types}
+        try:
+            for report_type, args in reports.items():
+                check_report_args(report_type, args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        results, errors = render_reports(reports)
+        if not results:
+            logging.error(f"Error generating report bundle: {errors}")
+            timed_out = all(error == 'timeout' for error in errors.values())
+            return jsonify({'error': 'Neizdevās ģenerēt atskaites', 'details': errors}), 504 if timed_out else 500
+
+        spool = tempfile.SpooledTemporaryFile(max_size=app.config['EXPORT_SPOOL_SIZE'])
+        with zipfile.ZipFile(spool, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for report_type in types:
+                if report_type in results:
+                    bundle.writestr(f"{report_type}_atskaite.pdf", results[report_type])
+            if errors:
+                bundle.writestr('kludas.txt', '\n'.join(
+                    f"{report_type}: {'pārsniegts laika limits' if error == 'timeout' else error}"
+                    for report_type, error in errors.items()
+                ))
+
+        return send_spooled(spool, f"atskaites_{datetime.date.today().isoformat()}.zip", 'application/zip')
+
+    except Exception as e:
+        logging.error(f"Error in export_bundle: {str(e)}")
+        return jsonify({'error': 'Servera kļūda'}), 500
+# Kolonnu formāta eksports (Arrow IPC / Parquet) analītikai; pyarrow nav obligāts
+app.config['COLUMNAR_BATCH_SIZE'] = int(os.getenv('COLUMNAR_BATCH_SIZE', 10000))
+
+COLUMNAR_FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def columnar_dataset(kind, args):
+    # Shēmas veidojam izsaukuma brīdī, jo pyarrow var nebūt instalēts
+    timestamp = pa.timestamp('us', tz='UTC')
+    if kind == 'orders':
+        schema = pa.schema([
+            ('id', pa.int64()), ('nosaukums', pa.string()), ('daudzums', pa.float64()),
+            ('employee_id', pa.int64()), ('status', pa.string()),
+            ('created_at', timestamp), ('updated_at', timestamp),
+        ])
+        query = list_query('orders', args).with_entities(
+            Order.id, Order.nosaukums, Order.daudzums, Order.employee_id, Order.status,
+            Order.created_at, Order.updated_at
+        )
+        return schema, query
+
+    if kind == 'materials':
+        schema = pa.schema([
+            ('id', pa.int64()), ('nosaukums', pa.string()), ('noliktava', pa.string()),
+            ('vieta', pa.string()), ('vieniba', pa.string()), ('daudzums', pa.float64()),
+            ('reorder_level', pa.float64()), ('version', pa.int64()),
+        ])
+        query = list_query('materials', args).with_entities(
+            Material.id, Material.nosaukums, Material.noliktava, Material.vieta, Material.vieniba,
+            Material.daudzums, Material.reorder_level, Material.version
+        )
+        return schema, query
+
+    if kind == 'shifts':
+        schema = pa.schema([
+            ('shift_id', pa.int64()), ('employee_id', pa.int64()), ('vards', pa.string()),
+            ('uzvards', pa.string()), ('amats', pa.string()),
+            ('start_time', timestamp), ('end_time', timestamp), ('hours', pa.float64()),
+        ])
+        query = db.session.query(
+            Shift.id, Employee.id, Employee.vards, Employee.uzvards, Employee.amats,
+            Shift.start_time, Shift.end_time, db.cast(shift_hours_expr(), db.Float)
+        ).join(Employee, Employee.id == Shift.employee_id).filter(
+            Shift.start_time.isnot(None),
+            Shift.end_time.isnot(None)
+        )
+        # Tie paši filtri kā /api/shifts/stats
+        start = args.get('start_date') or args.get('start')
+        end = args.get('end_date') or args.get('end')
+        if start:
+            query = query.filter(Shift.start_time >= parser.parse(start))
+        if end:
+            query = query.filter(Shift.end_time <= parser.parse(end))
+        employee_id = args.get('employee_id', type=int)
+        if employee_id:
+            query = query.filter(Shift.employee_id == employee_id)
+        return schema, query.order_by(Shift.id)
+
+    return None, None
+
+
+def columnar_batches(schema, query):
+    rows = iter(query.yield_per(app.config['COLUMNAR_BATCH_SIZE']))
+    while True:
+        chunk = list(itertools.islice(rows, app.config['COLUMNAR_BATCH_SIZE']))
+        if not chunk:
+            return
+        columns = zip(*chunk)
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        )
+
+
+@app.route('/api/export/<kind>', methods=['GET'])
+@token_required
+@read_replica
+@admission('export')
+def export_columnar(current_user, kind):
+    try:
+        if pa is None:
+            return jsonify({'error': 'Kolonnu eksports nav pieejams: serverī nav instalēts pyarrow'}), 501
+
+        export_format = request.args.get('format', 'arrow')
+        if export_format not in COLUMNAR_FORMATS:
+            return jsonify({'error': 'Nederīgs formāts, atļauts: arrow, parquet'}), 400
+
+        try:
+            schema, query = columnar_dataset(kind, request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if schema is None:
+            return jsonify({'error': 'Nederīgs datu veids, atļauts: orders, materials, shifts'}), 404
+
+        spool = tempfile.SpooledTemporaryFile(max_size=app.config['EXPORT_SPOOL_SIZE'])
+        if export_format == 'parquet':
+            writer = pq.ParquetWriter(spool, schema, compression='snappy')
+        else:
+            writer = pa.ipc.new_stream(spool, schema)
+        with writer:
+            for batch in columnar_batches(schema, query):
+                writer.write_batch(batch)
+
+        mimetype, extension = COLUMNAR_FORMATS[export_format]
+        return send_spooled(spool, f"{kind}.{extension}", mimetype)
+
+    except Exception as e:
+        logging.error(f"Error in columnar export: {str(e)}")
+        return jsonify({'error': 'Neizdevās eksportēt datus', 'details': str(e)}), 500
+
+
 @app.route('/materials/transfer', methods=['POST'])
 @token_required
 def transfer_material(current_user):
@@ -1310,14 +3414,15 @@ def transfer_material(current_user):
         return jsonify({'error': 'Nepieciešamie lauki nav aizpildīti vai daudzums ir pārāk mazs'}), 400
 
     
-    material_from = Material.query.filter_by(id=material_id, noliktava=from_noliktava).first()
+    material_from = Material.query.filter_by(id=material_id, noliktava=from_noliktava).with_for_update().first()
     if not material_from or material_from.daudzums < amount:
         return jsonify({'error': 'Avota noliktavā nav pietiekami daudz materiāla'}), 400
 
     
-    material_to = Material.query.filter_by(nosaukums=material_from.nosaukums, noliktava=to_noliktava).first()
+    material_to = Material.query.filter_by(nosaukums=material_from.nosaukums, noliktava=to_noliktava).with_for_update().first()
     if material_to:
         material_to.daudzums += amount
+        material_to.version += 1
     else:
         material_to = Material(
             nosaukums=material_from.nosaukums,
@@ -1330,10 +3435,155 @@ def transfer_material(current_user):
 
     
     material_from.daudzums -= amount
+    material_from.version += 1
+    db.session.flush()
+    record_stock_movement(material_from.id, -amount, 'transfer_out', current_user)
+    record_stock_movement(material_to.id, amount, 'transfer_in', current_user)
     db.session.commit()
 
     return jsonify({'success': True, 'message': 'Materiāls pārvietots veiksmīgi'}), 200
 
+@app.route('/materials/transfer/batch', methods=['POST'])
+@token_required
+def transfer_materials_batch(current_user):
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('lines'), list) or not data['lines']:
+            return jsonify({'error': 'Nav norādītas pārvietošanas rindas'}), 400
+
+        lines = []
+        for index, line in enumerate(data['lines']):
+            try:
+                amount = float(str(line.get('daudzums', 0)).replace(',', '.'))
+            except (ValueError, TypeError):
+                return jsonify({'error': f'Rinda {index + 1}: daudzumam jābūt skaitlim'}), 400
+            material_id = line.get('material_id')
+            from_noliktava = line.get('from_noliktava')
+            to_noliktava = line.get('to_noliktava')
+            if not material_id or not from_noliktava or not to_noliktava or amount < 0.01:
+                return jsonify({'error': f'Rinda {index + 1}: nepieciešamie lauki nav aizpildīti vai daudzums ir pārāk mazs'}), 400
+            if from_noliktava == to_noliktava:
+                return jsonify({'error': f'Rinda {index + 1}: avota un mērķa noliktava sakrīt'}), 400
+            lines.append({
+                'material_id': int(material_id),
+                'amount': amount,
+                'from_noliktava': from_noliktava,
+                'to_noliktava': to_noliktava,
+                'version': line.get('version')
+            })
+
+        # Nosaukumi vajadzīgi, lai atrastu mērķa rindas
+        source_ids = {line['material_id'] for line in lines}
+        names = dict(db.session.query(Material.id, Material.nosaukums).filter(Material.id.in_(source_ids)).all())
+        missing = source_ids - names.keys()
+        if missing:
+            return jsonify({'error': f'Materiāls ar ID {min(missing)} nav atrasts'}), 404
+
+        target_keys = {(names[line['material_id']], line['to_noliktava']) for line in lines}
+
+        # Bloķējam visas iesaistītās rindas vienā vaicājumā pēc ID, lai izvairītos no strupceļiem
+        locked = Material.query.filter(db.or_(
+            Material.id.in_(source_ids),
+            db.tuple_(Material.nosaukums, Material.noliktava).in_(target_keys)
+        )).order_by(Material.id).with_for_update().all()
+        by_id = {material.id: material for material in locked}
+        by_key = {}
+        for material in locked:
+            by_key.setdefault((material.nosaukums, material.noliktava), material)
+
+        deltas = {}
+        new_materials = {}
+        movements = []
+        for index, line in enumerate(lines):
+            source = by_id.get(line['material_id'])
+            if not source:
+                return jsonify({'error': f'Materiāls ar ID {line["material_id"]} nav atrasts'}), 404
+            if source.noliktava != line['from_noliktava']:
+                return jsonify({'error': f'Rinda {index + 1}: materiāls "{source.nosaukums}" neatrodas noliktavā {line["from_noliktava"]}'}), 400
+            if line['version'] is not None and source.version != line['version']:
+                return jsonify({
+                    'error': f'Materiāla "{source.nosaukums}" dati ir mainījušies. Lūdzu, atsvaidziniet lapu un mēģiniet vēlreiz.'
+                }), 409
+
+            deltas[source.id] = deltas.get(source.id, 0) - line['amount']
+
+            key = (source.nosaukums, line['to_noliktava'])
+            target = by_key.get(key)
+            if target:
+                deltas[target.id] = deltas.get(target.id, 0) + line['amount']
+            elif key in new_materials:
+                target = new_materials[key]
+                target.daudzums += line['amount']
+            else:
+                target = new_materials[key] = Material(
+                    nosaukums=source.nosaukums,
+                    noliktava=line['to_noliktava'],
+                    vieta=source.vieta,
+                    vieniba=source.vieniba,
+                    daudzums=line['amount'],
+                    version=1
+                )
+            movements.append((source, target, line['amount']))
+
+        # Pārbaudam daudzumu pēc visu rindu summēšanas
+        for material_id, delta in deltas.items():
+            material = by_id[material_id]
+            if material.daudzums + delta < 0:
+                return jsonify({
+                    'error': f'Nepietiek materiāla "{material.nosaukums}". Pieejams: {material.daudzums} {material.vieniba}'
+                }), 400
+
+        result = []
+        if deltas:
+            db.session.query(Material).filter(Material.id.in_(deltas.keys())).update({
+                Material.daudzums: Material.daudzums + db.case(deltas, value=Material.id),
+                Material.version: Material.version + 1
+            }, synchronize_session=False)
+            mark_cache_dirty('materials', deltas.keys())
+            record_stock_alerts([
+                low_stock_alert(
+                    material_id,
+                    (by_id[material_id].daudzums, by_id[material_id].reorder_level),
+                    (by_id[material_id].daudzums + delta, by_id[material_id].reorder_level)
+                )
+                for material_id, delta in deltas.items()
+            ])
+            for material in locked:
+                if material.id in deltas:
+                    result.append({
+                        'id': material.id,
+                        'noliktava': material.noliktava,
+                        'daudzums': material.daudzums + deltas[material.id],
+                        'version': material.version + 1
+                    })
+
+        db.session.add_all(new_materials.values())
+        db.session.flush()
+        for material in new_materials.values():
+            result.append({
+                'id': material.id,
+                'noliktava': material.noliktava,
+                'daudzums': material.daudzums,
+                'version': material.version
+            })
+
+        for source, target, amount in movements:
+            record_stock_movement(source.id, -amount, 'transfer_out', current_user)
+            record_stock_movement(target.id, amount, 'transfer_in', current_user)
+
+        db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'message': 'Materiāli pārvietoti veiksmīgi',
+            'materials': result
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error transferring materials: {str(e)}")
+        return jsonify({"error": "Neizdevās pārvietot materiālus", "details": str(e)}), 500
+
 @app.route("/orders/<int:order_id>/cancel", methods=["PATCH"])
 @token_required
 def cancel_order(current_user, order_id):
@@ -1358,11 +3608,18 @@ def cancel_order(current_user, order_id):
                 }), 409
 
         # Atgriežam materiālu daudzumus
+        consumption = []
         for order_material in order.materials:
             material = Material.query.get(order_material.material_id)
             if material:
                 material.daudzums += order_material.quantity
                 material.version += 1
+                order_material.material_version = material.version
+                record_stock_movement(material.id, order_material.quantity, 'order_cancel', current_user, order.id)
+                consumption.append((material.id, material.noliktava, -order_material.quantity))
+        # Patēriņa kopsavilkumā ir tikai pieņemtie pasūtījumi
+        if order.status == 'accepted':
+            record_consumption(consumption, acceptance_times([order.id]).get(order.id))
 
         # Atjauninām pasūtījuma statusu
         order.status = 'cancelled'
@@ -1379,6 +3636,162 @@ def cancel_order(current_user, order_id):
         logging.error(f"Error cancelling order: {str(e)}")
         return jsonify({"error": "Neizdevās atcelt pasūtījumu", "details": str(e)}), 500
 
+ORDER_TRANSITIONS = {
+    'accept': {
+        'allowed': lambda status: status == 'pending',
+        'status_error': 'Pasūtījums jau ir apstrādāts',
+        'status': 'accepted',
+        'stock_sign': -1,
+        'reason': 'order_accept',
+        'message': 'Pasūtījums pieņemts'
+    },
+    'finish': {
+        'allowed': lambda status: status == 'accepted',
+        'status_error': 'Pasūtījums nav pieņemts',
+        'status': 'finished',
+        'stock_sign': 0,
+        'reason': None,
+        'message': 'Pasūtījums pabeigts'
+    },
+    'cancel': {
+        'allowed': lambda status: status != 'finished',
+        'status_error': 'Pabeigtu pasūtījumu nevar atcelt',
+        'status': 'cancelled',
+        'stock_sign': 1,
+        'reason': 'order_cancel',
+        'message': 'Pasūtījums atcelts'
+    },
+}
+
+
+@app.route("/orders/batch/<action>", methods=["PATCH"])
+@token_required
+def batch_order_transition(current_user, action):
+    try:
+        transition = ORDER_TRANSITIONS.get(action)
+        if not transition:
+            return jsonify({'error': 'Nederīga darbība, atļauts: accept, finish, cancel'}), 404
+
+        data = request.get_json()
+        order_ids = data.get('order_ids') if isinstance(data, dict) else None
+        if not isinstance(order_ids, list) or not order_ids:
+            return jsonify({'error': 'Nav norādīti pasūtījumi'}), 400
+        if len(order_ids) > 1000:
+            return jsonify({'error': 'Vienā pieprasījumā atļauti ne vairāk kā 1000 pasūtījumi'}), 400
+        # Tikai veseli pozitīvi skaitļi vai to teksts; bool un daļskaitļi int() pieņemtu klusām
+        if any(isinstance(order_id, bool) or not isinstance(order_id, (int, str)) or not str(order_id).isdigit()
+               for order_id in order_ids):
+            return jsonify({'error': 'Nederīgs pasūtījuma ID'}), 400
+        order_ids = sorted({int(order_id) for order_id in order_ids})
+        atomic = bool(data.get('atomic'))
+
+        # Divi bloķējoši vaicājumi: pasūtījumi un to materiāli, abi pēc ID
+        orders = Order.query.filter(Order.id.in_(order_ids)).order_by(Order.id).with_for_update().all()
+        statuses = {order.id: order.status for order in orders}
+        links = {}
+        for link in OrderMaterial.query.filter(OrderMaterial.order_id.in_(order_ids)).all():
+            links.setdefault(link.order_id, []).append(link)
+        material_ids = {link.material_id for order_links in links.values() for link in order_links}
+        materials = {
+            material.id: material
+            for material in Material.query.filter(Material.id.in_(material_ids)).order_by(Material.id).with_for_update().all()
+        } if material_ids else {}
+
+        # Pārbaudām secīgi atmiņā, it kā pasūtījumi tiktu apstrādāti pa vienam
+        stock = {material_id: material.daudzums for material_id, material in materials.items()}
+        versions = {material_id: material.version for material_id, material in materials.items()}
+        deltas = {}
+        bumps = {}
+        applied = []
+        movements = []
+        results = {order_id: {'order_id': order_id, 'success': False, 'status': 404, 'error': 'Pasūtījums nav atrasts'} for order_id in order_ids}
+
+        for order in orders:
+            result = results[order.id]
+            if not transition['allowed'](order.status):
+                result.update(status=400, error=transition['status_error'])
+                continue
+
+            error = None
+            for link in links.get(order.id, []):
+                material = materials.get(link.material_id)
+                if not material:
+                    error = (404, f'Materiāls ar ID {link.material_id} nav atrasts')
+                    break
+                if versions[material.id] != link.material_version:
+                    error = (409, f'Materiāla "{material.nosaukums}" dati ir mainījušies. Lūdzu, atsvaidziniet lapu un mēģiniet vēlreiz.')
+                    break
+                if transition['stock_sign'] < 0 and stock[material.id] < link.quantity:
+                    error = (400, f'Nepietiek materiāla "{material.nosaukums}". Pieejams: {stock[material.id]} {material.vieniba}')
+                    break
+            if error:
+                result.update(status=error[0], error=error[1])
+                continue
+
+            if transition['stock_sign']:
+                for link in links.get(order.id, []):
+                    delta = transition['stock_sign'] * link.quantity
+                    stock[link.material_id] += delta
+                    versions[link.material_id] += 1
+                    link.material_version = versions[link.material_id]
+                    deltas[link.material_id] = deltas.get(link.material_id, 0) + delta
+                    bumps[link.material_id] = bumps.get(link.material_id, 0) + 1
+                    movements.append((link.material_id, delta, order.id))
+
+            applied.append(order.id)
+            result.update(success=True, status=200, error=None, message=transition['message'])
+
+        if atomic and len(applied) != len(order_ids):
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Ne visus pasūtījumus var apstrādāt, nekas netika mainīts',
+                'results': [results[order_id] for order_id in order_ids]
+            }), 409
+
+        if applied:
+            db.session.query(Order).filter(Order.id.in_(applied)).update(
+                {Order.status: transition['status']}, synchronize_session=False
+            )
+        if deltas:
+            db.session.query(Material).filter(Material.id.in_(deltas.keys())).update({
+                Material.daudzums: Material.daudzums + db.case(deltas, value=Material.id),
+                Material.version: Material.version + db.case(bumps, value=Material.id)
+            }, synchronize_session=False)
+            mark_cache_dirty('materials', deltas.keys())
+            record_stock_alerts([
+                low_stock_alert(
+                    material_id,
+                    (materials[material_id].daudzums, materials[material_id].reorder_level),
+                    (stock[material_id], materials[material_id].reorder_level)
+                )
+                for material_id in deltas
+            ])
+        for material_id, delta, order_id in movements:
+            record_stock_movement(material_id, delta, transition['reason'], current_user, order_id)
+        # Atceltie pieņemtie pasūtījumi tiek atskaitīti savas pieņemšanas periodā
+        accepted_at = acceptance_times([order_id for order_id in applied if statuses[order_id] == 'accepted']) if action != 'accept' else {}
+        consumption = {}
+        for material_id, delta, order_id in movements:
+            if action == 'accept' or statuses[order_id] == 'accepted':
+                consumption.setdefault(accepted_at.get(order_id), []).append((material_id, materials[material_id].noliktava, -delta))
+        for at, lines in consumption.items():
+            record_consumption(lines, at)
+
+        db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'applied': len(applied),
+            'failed': len(order_ids) - len(applied),
+            'results': [results[order_id] for order_id in order_ids]
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in batch order transition: {str(e)}")
+        return jsonify({"error": "Neizdevās apstrādāt pasūtījumus", "details": str(e)}), 500
+
 @app.route("/materials/<int:material_id>/move", methods=["PATCH"])
 @token_required
 def move_material(current_user, material_id):
@@ -1456,6 +3869,7 @@ def update_material_quantity(current_user, material_id):
             return jsonify({'error': 'Daudzumam jābūt vismaz 0.01'}), 400
 
         # Atjauninām materiāla daudzumu
+        record_stock_movement(material.id, float(data['daudzums']) - (material.daudzums or 0), 'adjust', current_user)
         material.daudzums = float(data['daudzums'])
         material.version += 1
 
@@ -1480,6 +3894,1102 @@ def update_material_quantity(current_user, material_id):
         logging.error(f"Error updating material quantity: {str(e)}")
         return jsonify({"error": "Neizdevās atjaunināt materiāla daudzumu", "details": str(e)}), 500
 
+@app.route("/materials/<int:material_id>/reorder_level", methods=["PATCH"])
+@token_required
+def update_material_reorder_level(current_user, material_id):
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Nav datu'}), 400
+
+        required_fields = ['reorder_level', 'version']
+        for field in required_fields:
+            if field not in data:
+                return jsonify({'error': f'Trūkst lauka: {field}'}), 400
+
+        material = Material.query.get(material_id)
+        if not material:
+            return jsonify({'error': 'Materiāls nav atrasts'}), 404
+
+        # Pārbaudam versiju
+        if material.version != data['version']:
+            return jsonify({
+                'error': f'Materiāla "{material.nosaukums}" dati ir mainījušies. Lūdzu, atsvaidziniet lapu un mēģiniet vēlreiz.'
+            }), 409
+
+        # null noņem slieksni
+        reorder_level = data['reorder_level']
+        if reorder_level is not None and float(reorder_level) < 0:
+            return jsonify({'error': 'Pasūtīšanas slieksnis nevar būt negatīvs'}), 400
+
+        material.reorder_level = float(reorder_level) if reorder_level is not None else None
+        material.version += 1
+
+        db.session.commit()
+
+        return jsonify({
+            "success": True,
+            "message": "Pasūtīšanas slieksnis atjaunināts",
+            "material": {
+                'id': material.id,
+                'nosaukums': material.nosaukums,
+                'daudzums': material.daudzums,
+                'reorder_level': material.reorder_level,
+                'low_stock': is_low_stock(material.daudzums, material.reorder_level),
+                'version': material.version
+            }
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error updating reorder level: {str(e)}")
+        return jsonify({"error": "Neizdevās atjaunināt pasūtīšanas slieksni", "details": str(e)}), 500
+
+@app.route("/api/stock/movements", methods=["GET"])
+@token_required
+@read_replica
+def get_stock_movements(current_user):
+    try:
+        material_id = request.args.get('material_id', type=int)
+        order_id = request.args.get('order_id', type=int)
+        start = request.args.get('start')
+        end = request.args.get('end')
+        limit = min(request.args.get('limit', 500, type=int), 5000)
+
+        query = StockMovement.query
+        if material_id:
+            query = query.filter(StockMovement.material_id == material_id)
+        if order_id:
+            query = query.filter(StockMovement.order_id == order_id)
+        if start:
+            query = query.filter(StockMovement.created_at >= parser.parse(start))
+        if end:
+            query = query.filter(StockMovement.created_at <= parser.parse(end))
+
+        movements = query.order_by(StockMovement.id.desc()).limit(limit).all()
+        return jsonify([{
+            'id': movement.id,
+            'material_id': movement.material_id,
+            'delta': movement.delta,
+            'reason': movement.reason,
+            'order_id': movement.order_id,
+            'employee_id': movement.employee_id,
+            'created_at': movement.created_at.isoformat() if movement.created_at else None
+        } for movement in movements]), 200
+
+    except Exception as e:
+        logging.error(f"Error getting stock movements: {str(e)}")
+        return jsonify({"error": "Neizdevās iegūt krājumu kustības", "details": str(e)}), 500
+
+
+@app.route("/api/stock/snapshots", methods=["POST"])
+@token_required
+def create_stock_snapshots(current_user):
+    try:
+        count = take_stock_snapshots()
+        db.session.commit()
+        return jsonify({"success": True, "snapshots": count}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error creating stock snapshots: {str(e)}")
+        return jsonify({"error": "Neizdevās izveidot krājumu momentuzņēmumus", "details": str(e)}), 500
+
+
+@app.route("/api/stock/as_of", methods=["GET"])
+@token_required
+@read_replica
+@admission('report')
+def get_stock_as_of(current_user):
+    try:
+        date = request.args.get('date')
+        if not date:
+            return jsonify({"error": "Trūkst parametra: date"}), 400
+        as_of = parser.parse(date)
+        material_id = request.args.get('material_id', type=int)
+
+        stock = stock_as_of(as_of, material_id)
+        names = dict(db.session.query(Material.id, Material.nosaukums).filter(Material.id.in_(stock.keys())).all()) if stock else {}
+
+        return jsonify({
+            "date": as_of.isoformat(),
+            "materials": [{
+                "id": stock_material_id,
+                "nosaukums": names.get(stock_material_id),
+                "daudzums": round(daudzums, 4)
+            } for stock_material_id, daudzums in sorted(stock.items())]
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error getting stock as of date: {str(e)}")
+        return jsonify({"error": "Neizdevās aprēķināt krājumus", "details": str(e)}), 500
+
+# Patēriņa kopsavilkumi pa stundām un dienām, tiek papildināti pieņemot pasūtījumus
+CONSUMPTION_ROLLUPS = {'hour': ConsumptionHourly, 'day': ConsumptionDaily}
+
+
+def utc_naive(value):
+    if value.tzinfo:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def consumption_bucket(bucket, at):
+    if bucket == 'hour':
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def consumption_upserts(dialect, lines, at=None):
+    # lines: (material_id, noliktava, daudzums); atcelšanai daudzums ir negatīvs
+    at = utc_naive(at or datetime.datetime.utcnow())
+    totals = {}
+    for material_id, noliktava, quantity in lines:
+        key = (material_id, noliktava or '')
+        total, count = totals.get(key, (0, 0))
+        totals[key] = (total + quantity, count + (1 if quantity > 0 else -1))
+    if not totals:
+        return []
+
+    insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+    statements = []
+    for bucket, model in CONSUMPTION_ROLLUPS.items():
+        table = model.__table__
+        statement = insert(table).values([{
+            'material_id': material_id,
+            'noliktava': noliktava,
+            'bucket': consumption_bucket(bucket, at),
+            'quantity': total,
+            'lines': count
+        } for (material_id, noliktava), (total, count) in totals.items()])
+        statements.append(statement.on_conflict_do_update(
+            index_elements=[table.c.material_id, table.c.noliktava, table.c.bucket],
+            set_={
+                'quantity': table.c.quantity + statement.excluded.quantity,
+                'lines': table.c.lines + statement.excluded.lines
+            }
+        ))
+    return statements
+
+
+def record_consumption(lines, at=None):
+    for statement in consumption_upserts(db.engine.dialect.name, lines, at):
+        db.session.execute(statement)
+
+
+# Statusi, kuru pasūtījumi ir ieskaitīti patēriņa kopsavilkumā, un kustības, kas to maina
+CONSUMED_STATUSES = ('accepted', 'finished')
+CONSUMPTION_REASONS = ('order_accept', 'order_update', 'order_cancel', 'order_delete')
+
+
+def acceptance_times(order_ids):
+    # Atcelšanu atskaitām tajā stundā/dienā, kurā pieņemšana tika ieskaitīta kopsavilkumā
+    if not order_ids:
+        return {}
+    rows = db.session.query(StockMovement.order_id, func.max(StockMovement.created_at)).filter(
+        StockMovement.reason == 'order_accept',
+        StockMovement.order_id.in_(order_ids)
+    ).group_by(StockMovement.order_id).all()
+    return {order_id: accepted_at for order_id, accepted_at in rows}
+
+
+def rebuild_consumption_rollups():
+    # Atjaunojam no krājumu žurnāla; labojumi, atcelšana un dzēšana skaitās tikai pieņemtiem pasūtījumiem
+    rows = db.session.query(
+        StockMovement.order_id, StockMovement.material_id, StockMovement.delta,
+        StockMovement.reason, StockMovement.created_at, Material.noliktava
+    ).outerjoin(Material, Material.id == StockMovement.material_id) \
+     .filter(StockMovement.reason.in_(CONSUMPTION_REASONS)) \
+     .order_by(StockMovement.id).all()
+
+    accepted = {}
+    totals = {bucket: {} for bucket in CONSUMPTION_ROLLUPS}
+    for order_id, material_id, delta, reason, created_at, noliktava in rows:
+        if reason == 'order_accept':
+            accepted[order_id] = created_at
+        if order_id not in accepted:
+            continue
+        # Izmaiņas tiek ieskaitītas pieņemšanas periodā
+        at = utc_naive(accepted[order_id])
+        if reason in ('order_cancel', 'order_delete'):
+            del accepted[order_id]
+        for bucket, bucket_totals in totals.items():
+            key = (material_id, noliktava or '', consumption_bucket(bucket, at))
+            total, count = bucket_totals.get(key, (0, 0))
+            bucket_totals[key] = (total - delta, count + (1 if delta < 0 else -1))
+
+    for bucket, model in CONSUMPTION_ROLLUPS.items():
+        db.session.query(model).delete(synchronize_session=False)
+        if totals[bucket]:
+            db.session.execute(db.insert(model.__table__), [{
+                'material_id': material_id,
+                'noliktava': noliktava,
+                'bucket': bucket_start,
+                'quantity': total,
+                'lines': count
+            } for (material_id, noliktava, bucket_start), (total, count) in totals[bucket].items()])
+    return {bucket: len(bucket_totals) for bucket, bucket_totals in totals.items()}
+
+
+@app.route("/api/consumption", methods=["GET"])
+@token_required
+@read_replica
+def get_consumption(current_user):
+    try:
+        bucket = request.args.get('bucket', 'day')
+        model = CONSUMPTION_ROLLUPS.get(bucket)
+        if not model:
+            return jsonify({"error": "Nederīgs intervāls, atļauts: hour, day"}), 400
+
+        query = model.query
+        material_id = request.args.get('material_id', type=int)
+        if material_id:
+            query = query.filter(model.material_id == material_id)
+        noliktava = request.args.get('noliktava')
+        if noliktava:
+            query = query.filter(model.noliktava == noliktava)
+        start = request.args.get('start_date')
+        if start:
+            query = query.filter(model.bucket >= utc_naive(parser.parse(start)))
+        end = request.args.get('end_date')
+        if end:
+            query = query.filter(model.bucket <= utc_naive(parser.parse(end)))
+
+        rows = query.order_by(model.bucket, model.material_id, model.noliktava).limit(MAX_LIST_LIMIT).all()
+        return jsonify({
+            'bucket': bucket,
+            'rows': [{
+                'material_id': row.material_id,
+                'noliktava': row.noliktava,
+                'bucket': row.bucket.isoformat(),
+                'quantity': round(row.quantity, 4),
+                'lines': row.lines
+            } for row in rows]
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error getting consumption: {str(e)}")
+        return jsonify({"error": "Neizdevās iegūt patēriņa datus", "details": str(e)}), 500
+
+
+@app.route("/api/consumption/rebuild", methods=["POST"])
+@token_required
+@admission('report')
+def rebuild_consumption(current_user):
+    try:
+        counts = rebuild_consumption_rollups()
+        db.session.commit()
+        return jsonify({"success": True, "rows": counts}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error rebuilding consumption rollups: {str(e)}")
+        return jsonify({"error": "Neizdevās pārrēķināt patēriņa datus", "details": str(e)}), 500
+
+
+# Patēriņa prognoze un pasūtīšanas punkti
+app.config['FORECAST_HISTORY_DAYS'] = int(os.getenv('FORECAST_HISTORY_DAYS', 90))
+app.config['FORECAST_SHORT_WINDOW'] = int(os.getenv('FORECAST_SHORT_WINDOW', 7))
+app.config['FORECAST_LONG_WINDOW'] = int(os.getenv('FORECAST_LONG_WINDOW', 28))
+app.config['FORECAST_LEAD_TIME_DAYS'] = float(os.getenv('FORECAST_LEAD_TIME_DAYS', 7))
+# z vērtība drošības krājumam (1.65 ~ 95% apkalpošanas līmenis)
+app.config['FORECAST_SERVICE_Z'] = float(os.getenv('FORECAST_SERVICE_Z', 1.65))
+
+
+def compute_material_forecasts(as_of=None):
+    as_of = utc_naive(as_of or datetime.datetime.utcnow())
+    days = app.config['FORECAST_HISTORY_DAYS']
+    end_day = np.datetime64(as_of.date(), 'D')
+    start_day = end_day - (days - 1)
+    start = datetime.datetime.combine(start_day.astype(datetime.date), datetime.time())
+
+    materials = db.session.query(Material.id, Material.daudzums).order_by(Material.id).all()
+    if not materials:
+        return 0
+    material_ids = np.array([material_id for material_id, _ in materials], dtype=np.int64)
+    stock = np.array([daudzums or 0 for _, daudzums in materials], dtype=float)
+
+    # Patēriņš no dienas kopsavilkuma: tajā ir tikai pieņemtie pasūtījumi, atcelšanas jau atskaitītas.
+    # Krājumu žurnālā viena pasūtījuma daudzums parādās gan izveidē, gan pieņemšanā, tāpēc tas patēriņu dubultotu
+    rows = db.session.query(ConsumptionDaily.material_id, ConsumptionDaily.quantity, ConsumptionDaily.bucket).filter(
+        ConsumptionDaily.bucket >= start,
+        ConsumptionDaily.bucket <= as_of
+    ).all()
+
+    # Matrica materiāli x dienas ar neto patēriņu
+    usage = np.zeros((len(material_ids), days))
+    if rows:
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        consumed = np.array([row[1] for row in rows], dtype=float)
+        day_index = (np.array([utc_naive(row[2]) for row in rows], dtype='datetime64[D]') - start_day).astype(np.int64)
+        row_index = np.searchsorted(material_ids, ids)
+        # Izdzēstu materiālu kustības izlaižam
+        known = (row_index < len(material_ids)) & (material_ids[np.minimum(row_index, len(material_ids) - 1)] == ids)
+        known &= (day_index >= 0) & (day_index < days)
+        np.add.at(usage, (row_index[known], day_index[known]), consumed[known])
+
+    cumulative = np.cumsum(usage, axis=1)
+
+    def moving_average(window):
+        window = max(1, min(window, days))
+        before = cumulative[:, -window - 1] if window < days else 0
+        return (cumulative[:, -1] - before) / window
+
+    daily_rate = np.maximum(usage.mean(axis=1), 0)
+    short = np.maximum(moving_average(app.config['FORECAST_SHORT_WINDOW']), 0)
+    long = np.maximum(moving_average(app.config['FORECAST_LONG_WINDOW']), 0)
+    variance = usage.var(axis=1, ddof=1) if days > 1 else np.zeros(len(material_ids))
+
+    lead_time = app.config['FORECAST_LEAD_TIME_DAYS']
+    safety_stock = app.config['FORECAST_SERVICE_Z'] * np.sqrt(variance * lead_time)
+    reorder_point = long * lead_time + safety_stock
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(long > 0, stock / long, np.nan)
+
+    computed_at = datetime.datetime.utcnow()
+    forecasts = [{
+        'material_id': material_id,
+        'daily_rate': round(rate, 4),
+        'moving_avg_short': round(short_avg, 4),
+        'moving_avg_long': round(long_avg, 4),
+        'variance': round(var, 4),
+        'safety_stock': round(safety, 4),
+        'reorder_point': round(point, 4),
+        'days_of_cover': None if math.isnan(cover) else round(cover, 2),
+        'history_days': days,
+        'computed_at': computed_at
+    } for material_id, rate, short_avg, long_avg, var, safety, point, cover in zip(
+        material_ids.tolist(), daily_rate.tolist(), short.tolist(), long.tolist(),
+        variance.tolist(), safety_stock.tolist(), reorder_point.tolist(), days_of_cover.tolist()
+    )]
+
+    db.session.query(MaterialForecast).delete(synchronize_session=False)
+    db.session.execute(db.insert(MaterialForecast.__table__), forecasts)
+    return len(forecasts)
+
+
+@app.route("/api/forecast/run", methods=["POST"])
+@token_required
+@admission('report')
+def run_material_forecast(current_user):
+    try:
+        data = request.get_json(silent=True) or {}
+        as_of = parser.parse(data['as_of']) if data.get('as_of') else None
+        count = compute_material_forecasts(as_of)
+        db.session.commit()
+        return jsonify({"success": True, "materials": count}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error computing forecasts: {str(e)}")
+        return jsonify({"error": "Neizdevās aprēķināt prognozi", "details": str(e)}), 500
+
+
+@app.route("/api/forecast", methods=["GET"])
+@token_required
+@read_replica
+def get_material_forecast(current_user):
+    try:
+        query = db.session.query(MaterialForecast, Material.nosaukums, Material.noliktava, Material.daudzums, Material.vieniba) \
+            .join(Material, Material.id == MaterialForecast.material_id)
+        material_id = request.args.get('material_id', type=int)
+        if material_id:
+            query = query.filter(MaterialForecast.material_id == material_id)
+        if request.args.get('reorder') in ('1', 'true'):
+            # Tikai materiāli, kuru krājumi jau ir zem ieteiktā pasūtīšanas punkta
+            query = query.filter(Material.daudzums <= MaterialForecast.reorder_point, MaterialForecast.reorder_point > 0)
+
+        rows = query.order_by(MaterialForecast.material_id).all()
+        return jsonify([{
+            'material_id': forecast.material_id,
+            'nosaukums': nosaukums,
+            'noliktava': noliktava,
+            'daudzums': daudzums,
+            'vieniba': vieniba,
+            'daily_rate': forecast.daily_rate,
+            'moving_avg_short': forecast.moving_avg_short,
+            'moving_avg_long': forecast.moving_avg_long,
+            'variance': forecast.variance,
+            'safety_stock': forecast.safety_stock,
+            'reorder_point': forecast.reorder_point,
+            'days_of_cover': forecast.days_of_cover,
+            'history_days': forecast.history_days,
+            'computed_at': forecast.computed_at.isoformat() if forecast.computed_at else None
+        } for forecast, nosaukums, noliktava, daudzums, vieniba in rows]), 200
+
+    except Exception as e:
+        logging.error(f"Error getting forecasts: {str(e)}")
+        return jsonify({"error": "Neizdevās iegūt prognozi", "details": str(e)}), 500
+
+
+@app.route("/api/stock/low", methods=["GET"])
+@token_required
+@read_replica
+def get_low_stock(current_user):
+    try:
+        # Nosacījums sakrīt ar daļējā indeksa nosacījumu, tādēļ tiek lasītas tikai mazo krājumu rindas
+        query = Material.query.filter(Material.daudzums < Material.reorder_level)
+        noliktava = request.args.get('noliktava')
+        if noliktava:
+            query = query.filter(Material.noliktava == noliktava)
+
+        materials = sorted(query.all(), key=lambda material: material.daudzums / material.reorder_level if material.reorder_level else 0)
+        return jsonify([{
+            'id': material.id,
+            'nosaukums': material.nosaukums,
+            'noliktava': material.noliktava,
+            'vieta': material.vieta,
+            'vieniba': material.vieniba,
+            'daudzums': material.daudzums,
+            'reorder_level': material.reorder_level,
+            'shortage': round(material.reorder_level - material.daudzums, 4),
+            'version': material.version
+        } for material in materials]), 200
+
+    except Exception as e:
+        logging.error(f"Error getting low stock: {str(e)}")
+        return jsonify({"error": "Neizdevās iegūt mazo krājumu sarakstu", "details": str(e)}), 500
+
+
+def stock_alert_dict(alert):
+    return {
+        'id': alert.id,
+        'material_id': alert.material_id,
+        'kind': alert.kind,
+        'daudzums': alert.daudzums,
+        'reorder_level': alert.reorder_level,
+        'created_at': alert.created_at.isoformat() if alert.created_at else None
+    }
+
+
+def stock_alerts_after(after_id, material_id=None, limit=100):
+    query = StockAlert.query.filter(StockAlert.id > after_id)
+    if material_id:
+        query = query.filter(StockAlert.material_id == material_id)
+    return query.order_by(StockAlert.id).limit(limit).all()
+
+
+@app.route("/api/stock/alerts", methods=["GET"])
+@token_required
+@read_replica
+def get_stock_alerts(current_user):
+    try:
+        after_id = request.args.get('after_id', 0, type=int)
+        material_id = request.args.get('material_id', type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+
+        alerts = stock_alerts_after(after_id, material_id, limit)
+        return jsonify({
+            'alerts': [stock_alert_dict(alert) for alert in alerts],
+            'last_id': alerts[-1].id if alerts else after_id
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error getting stock alerts: {str(e)}")
+        return jsonify({"error": "Neizdevās iegūt krājumu brīdinājumus", "details": str(e)}), 500
+
+
+@app.route("/api/stock/alerts/stream", methods=["GET"])
+@token_required
+def stream_stock_alerts(current_user):
+    # Server-Sent Events; pēc savienojuma pārtraukuma klients turpina ar Last-Event-ID
+    last_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('after_id', 0, type=int)
+    material_id = request.args.get('material_id', type=int)
+
+    def events(last_id):
+        started = time.monotonic()
+        last_sent = started
+        yield 'retry: 3000\n\n'
+        while time.monotonic() - started < app.config['STOCK_ALERT_STREAM_TIMEOUT']:
+            alerts = stock_alerts_after(last_id, material_id)
+            # Atbrīvojam savienojumu, kamēr gaidām nākamos notikumus
+            db.session.remove()
+            for alert in alerts:
+                last_id = alert.id
+                yield f"id: {alert.id}\nevent: {alert.kind}\ndata: {json.dumps(stock_alert_dict(alert))}\n\n"
+            if alerts:
+                last_sent = time.monotonic()
+                continue
+            if time.monotonic() - last_sent >= app.config['STOCK_ALERT_HEARTBEAT']:
+                last_sent = time.monotonic()
+                yield ': keepalive\n\n'
+            with stock_alert_signal:
+                stock_alert_signal.wait(app.config['STOCK_ALERT_POLL_INTERVAL'])
+
+    response = app.response_class(stream_with_context(events(last_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Vairāki apakšpieprasījumi vienā HTTP pieprasījumā; secīgi GET tiek izpildīti paralēli
+app.config['BATCH_MAX_REQUESTS'] = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+app.config['BATCH_WORKERS'] = int(os.getenv('BATCH_WORKERS', 4))
+
+BATCH_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+BATCH_READ_METHODS = ('GET', 'HEAD')
+BATCH_SKIPPED_HEADERS = ('Content-Length', 'Content-Encoding', 'Transfer-Encoding', 'Vary', 'Set-Cookie')
+
+
+def batch_result(item_id, response):
+    result = {'id': item_id, 'status': response.status_code}
+    if response.mimetype == 'text/event-stream':
+        response.close()
+        result.update(status=400, body={"error": "Straumējošas atbildes nav atbalstītas"})
+        return result
+    response.direct_passthrough = False
+    result['headers'] = {key: value for key, value in response.headers.items() if key not in BATCH_SKIPPED_HEADERS}
+    if response.is_json:
+        result['body'] = response.get_json(silent=True)
+    elif response.mimetype.startswith('text/'):
+        result['body'] = response.get_data(as_text=True)
+    else:
+        result['body'] = base64.b64encode(response.get_data()).decode('ascii')
+        result['encoding'] = 'base64'
+    return result
+
+
+def run_batch_request(item_id, environ):
+    # Katram apakšpieprasījumam sava lietotnes konteksts, tātad arī savs g un datubāzes sesija
+    try:
+        with app.app_context(), app.request_context(environ):
+            try:
+                response = app.full_dispatch_request()
+            except Exception as e:
+                response = app.handle_exception(e)
+            return batch_result(item_id, response)
+    except Exception as e:
+        logging.error(f"Error in batch request {item_id}: {str(e)}")
+        return {'id': item_id, 'status': 500, 'body': {"error": "Servera kļūda", "details": str(e)}}
+
+
+def batch_groups(items, sequential):
+    # Lasīšanas pieprasījumi starp rakstīšanām veido grupu, ko drīkst izpildīt vienlaicīgi
+    group = []
+    for item in items:
+        if not sequential and item['method'] in BATCH_READ_METHODS:
+            group.append(item)
+            continue
+        if group:
+            yield group
+            group = []
+        yield [item]
+    if group:
+        yield group
+
+
+@app.route("/batch", methods=["POST"])
+@token_required
+def batch(current_user):
+    data = request.get_json(silent=True) or {}
+    items = data.get('requests')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Nepieciešams pieprasījumu saraksts 'requests'"}), 400
+    if len(items) > app.config['BATCH_MAX_REQUESTS']:
+        return jsonify({"error": f"Maksimālais pieprasījumu skaits ir {app.config['BATCH_MAX_REQUESTS']}"}), 400
+
+    prepared = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return jsonify({"error": "Nederīgs pieprasījums", "index": index}), 400
+        method = str(item.get('method', 'GET')).upper()
+        path = item.get('path')
+        headers = item.get('headers') or {}
+        if method not in BATCH_METHODS:
+            return jsonify({"error": "Nederīga metode", "index": index, "allowed": list(BATCH_METHODS)}), 400
+        if not isinstance(path, str) or not path.startswith('/') or path.startswith('//'):
+            return jsonify({"error": "Nederīgs ceļš", "index": index}), 400
+        if path.split('?', 1)[0].rstrip('/') == '/batch':
+            return jsonify({"error": "Ligzdoti /batch pieprasījumi nav atļauti", "index": index}), 400
+        if not isinstance(headers, dict):
+            return jsonify({"error": "Nederīgas galvenes", "index": index}), 400
+
+        headers = {str(key): str(value) for key, value in headers.items() if str(key).lower() != 'authorization'}
+        headers['Authorization'] = request.headers.get('Authorization', '')
+        if g.get('request_id'):
+            headers['X-Request-ID'] = f"{g.request_id}-{index}"
+        builder = EnvironBuilder(
+            path=path,
+            method=method,
+            headers=headers,
+            json=item['body'] if item.get('body') is not None else None,
+            base_url=request.url_root,
+            environ_overrides={'REMOTE_ADDR': request.remote_addr, 'kv.batch_user': current_user}
+        )
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+        prepared.append({'id': item.get('id', index), 'method': method, 'environ': environ})
+
+    results = []
+    for group in batch_groups(prepared, bool(data.get('sequential'))):
+        if len(group) == 1 or app.config['BATCH_WORKERS'] <= 1:
+            results.extend(run_batch_request(item['id'], item['environ']) for item in group)
+            continue
+        with ThreadPoolExecutor(max_workers=min(app.config['BATCH_WORKERS'], len(group)), thread_name_prefix='batch') as executor:
+            results.extend(executor.map(lambda item: run_batch_request(item['id'], item['environ']), group))
+    return jsonify({'responses': results}), 200
+
+
+# Pieprasījumu profilēšana pēc pieprasījuma: administratora galvene X-Profile: 1 vai izlase
+app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'kv-profiles'))
+app.config['PROFILE_MAX_FILES'] = int(os.getenv('PROFILE_MAX_FILES', 50))
+app.config['PROFILE_MAX_STATEMENTS'] = int(os.getenv('PROFILE_MAX_STATEMENTS', 1000))
+
+PROFILE_ID_PATTERN = re.compile(r'^[\w\-]+$')
+
+# SQL laika skala tiek vākta tikai tajā pavedienā, kurā notiek profilēšana
+profile_local = threading.local()
+
+
+def is_admin(user):
+    return user is not None and user.amats == 'Administrators'
+
+
+def profile_requested():
+    if request.headers.get('X-Profile') == '1':
+        token = request.headers.get('Authorization', '')
+        if token.startswith('Bearer '):
+            try:
+                decoded = jwt.decode(token[7:], SECRET_KEY, algorithms=["HS256"])
+            except jwt.InvalidTokenError:
+                return False
+            return is_admin(db.session.get(Employee, decoded['user_id']))
+        return False
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+@app.before_request
+def start_profile():
+    if not profile_requested():
+        return
+    g.profile_started = time.perf_counter()
+    profile_local.timeline = []
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+
+def record_profile_statement(timeline, started, duration, statement, executemany):
+    if len(timeline) >= app.config['PROFILE_MAX_STATEMENTS']:
+        return
+    timeline.append({
+        'offset_ms': round((started - g.profile_started) * 1000, 3) if has_request_context() and 'profile_started' in g else None,
+        'duration_ms': round(duration * 1000, 3),
+        'statement': statement[:2000],
+        'executemany': executemany
+    })
+
+
+def stop_profile():
+    profiler = g.pop('profiler', None)
+    if profiler:
+        profiler.disable()
+    timeline = getattr(profile_local, 'timeline', None)
+    profile_local.timeline = None
+    return profiler, timeline or []
+
+
+def save_profile(profiler, timeline, status):
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    # X-Request-ID var saturēt punktus, bet profila nosaukumā atļauti tikai PROFILE_ID_PATTERN simboli
+    request_id = re.sub(r'[^\w\-]', '_', g.get('request_id') or uuid.uuid4().hex)
+    profile_id = f"{datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{request_id}"
+    profiler.dump_stats(os.path.join(directory, f"{profile_id}.pstats"))
+
+    stats = pstats.Stats(profiler)
+    functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:30]
+    with open(os.path.join(directory, f"{profile_id}.json"), 'w', encoding='utf-8') as summary:
+        json.dump({
+            'id': profile_id,
+            'method': request.method,
+            'path': request.full_path,
+            'status': status,
+            'duration_ms': round((time.perf_counter() - g.profile_started) * 1000, 3),
+            'sql_count': len(timeline),
+            'sql_ms': round(sum(entry['duration_ms'] for entry in timeline), 3),
+            'sql': timeline,
+            'functions': [{
+                'function': f"{filename}:{line}({name})",
+                'calls': calls,
+                'total_ms': round(total * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3)
+            } for (filename, line, name), (_, calls, total, cumulative, _) in functions]
+        }, summary, ensure_ascii=False)
+
+    # Direktorijas apjoms ir ierobežots: atstājam tikai jaunākos profilus
+    profiles = sorted({
+        os.path.splitext(name)[0] for name in os.listdir(directory) if os.path.splitext(name)[1] in ('.pstats', '.json')
+    })
+    for stale in profiles[:-app.config['PROFILE_MAX_FILES']] if app.config['PROFILE_MAX_FILES'] > 0 else profiles:
+        for extension in ('pstats', 'json'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, f"{stale}.{extension}"))
+    return profile_id
+
+
+@app.after_request
+def finish_profile(response):
+    if 'profiler' not in g:
+        return response
+    profiler, timeline = stop_profile()
+    try:
+        response.headers['X-Profile-Id'] = save_profile(profiler, timeline, response.status_code)
+    except Exception as e:
+        logging.warning(f"Could not save profile: {str(e)}")
+    return response
+
+
+@app.teardown_request
+def discard_profile(exc):
+    # Ja skats beidzās ar neapstrādātu izņēmumu, after_request netiek izsaukts
+    if 'profiler' in g:
+        stop_profile()
+
+
+@app.route("/api/profiles", methods=["GET"])
+@token_required
+def list_profiles(current_user):
+    if not is_admin(current_user):
+        return jsonify({"error": "Nav tiesību"}), 403
+    directory = app.config['PROFILE_DIR']
+    if not os.path.isdir(directory):
+        return jsonify([]), 200
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as summary:
+                data = json.load(summary)
+        except (OSError, ValueError):
+            continue
+        profiles.append({key: data.get(key) for key in ('id', 'method', 'path', 'status', 'duration_ms', 'sql_count', 'sql_ms')})
+    return jsonify(profiles), 200
+
+
+@app.route("/api/profiles/<profile_id>.<extension>", methods=["GET"])
+@token_required
+def get_profile(current_user, profile_id, extension):
+    if not is_admin(current_user):
+        return jsonify({"error": "Nav tiesību"}), 403
+    if extension not in ('pstats', 'json') or not PROFILE_ID_PATTERN.match(profile_id):
+        return jsonify({"error": "Profils nav atrasts"}), 404
+    path = os.path.join(app.config['PROFILE_DIR'], f"{profile_id}.{extension}")
+    if not os.path.isfile(path):
+        return jsonify({"error": "Profils nav atrasts"}), 404
+    return send_file(path, as_attachment=True, download_name=f"{profile_id}.{extension}",
+                     mimetype='application/json' if extension == 'json' else 'application/octet-stream')
+
+
+# Lēno vaicājumu žurnāls: SQL priekšraksti virs sliekšņa tiek apkopoti pēc teksta (0 izslēdz)
+app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+app.config['SLOW_QUERY_MAX_ENTRIES'] = int(os.getenv('SLOW_QUERY_MAX_ENTRIES', 200))
+# EXPLAIN (bez ANALYZE) tiek izpildīts vienreiz katram lēnajam SELECT priekšrakstam
+app.config['SLOW_QUERY_EXPLAIN'] = os.getenv('SLOW_QUERY_EXPLAIN', '0') == '1'
+
+SLOW_QUERY_IN_LIST = re.compile(r'\bIN \((?:\s*(?:\?|%\(\w+\)s|%s)\s*,)+\s*(?:\?|%\(\w+\)s|%s)\s*\)', re.IGNORECASE)
+SLOW_QUERY_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+SLOW_QUERY_SORTS = {'total': 'total_ms', 'max': 'max_ms', 'count': 'count', 'last': 'last_seen'}
+
+slow_queries = OrderedDict()
+slow_query_lock = threading.Lock()
+
+
+def slow_query_key(statement):
+    # Paplašinātie IN saraksti katram garumam dod citu tekstu, tāpēc tos apvieno
+    return SLOW_QUERY_IN_LIST.sub('IN (...)', ' '.join(statement.split()))[:4000]
+
+
+def parameter_shape(parameters, executemany=False):
+    if executemany:
+        parameters = list(parameters or [])
+        return {'rows': len(parameters), 'row': parameter_shape(parameters[0]) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__ if parameters is not None else None
+
+
+def explain_statement(dialect, cursor, statement, parameters):
+    # Atsevišķs DBAPI kursors, lai EXPLAIN neizsauc šos pašus notikumus un nesabojā galvenā kursora rezultātu
+    explain = cursor.connection.cursor()
+    try:
+        if dialect == 'postgresql':
+            explain.execute('SAVEPOINT slow_query_explain')
+            try:
+                explain.execute('EXPLAIN ' + statement, parameters)
+                plan = [row[0] for row in explain.fetchall()]
+            except Exception:
+                explain.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                raise
+            explain.execute('RELEASE SAVEPOINT slow_query_explain')
+            return plan
+        if dialect == 'sqlite':
+            explain.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            return [row[-1] for row in explain.fetchall()]
+        return None
+    finally:
+        explain.close()
+
+
+def record_slow_query(conn, cursor, statement, parameters, executemany, duration):
+    duration_ms = round(duration * 1000, 3)
+    key = slow_query_key(statement)
+    route = (request.endpoint or request.path) if has_request_context() else 'background'
+    shape = parameter_shape(parameters, executemany)
+    logging.getLogger('api.slow_query').warning('Slow query %.1f ms', duration_ms, extra={'sql': {
+        'statement': key[:500],
+        'duration_ms': duration_ms,
+        'route': route,
+        'parameters': shape
+    }})
+
+    with slow_query_lock:
+        entry = slow_queries.pop(key, None) or {
+            'statement': key, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'routes': {}, 'plan': None
+        }
+        entry['count'] += 1
+        entry['total_ms'] = round(entry['total_ms'] + duration_ms, 3)
+        entry['max_ms'] = max(entry['max_ms'], duration_ms)
+        entry['last_ms'] = duration_ms
+        entry['last_seen'] = datetime.datetime.utcnow().isoformat()
+        entry['parameters'] = shape
+        entry['routes'][route] = entry['routes'].get(route, 0) + 1
+        slow_queries[key] = entry
+        while len(slow_queries) > app.config['SLOW_QUERY_MAX_ENTRIES']:
+            slow_queries.popitem(last=False)
+        needs_plan = entry['plan'] is None
+
+    if needs_plan and app.config['SLOW_QUERY_EXPLAIN'] and not executemany and SLOW_QUERY_EXPLAINABLE.match(statement):
+        try:
+            plan = explain_statement(conn.dialect.name, cursor, statement, parameters)
+        except Exception as e:
+            plan = [f"EXPLAIN neizdevās: {str(e)}"]
+        with slow_query_lock:
+            if key in slow_queries:
+                slow_queries[key]['plan'] = plan
+
+
+@db.event.listens_for(db.Engine, 'before_cursor_execute')
+def time_before_execute(conn, cursor, statement, parameters, context, executemany):
+    if app.config['SLOW_QUERY_THRESHOLD_MS'] > 0 or getattr(profile_local, 'timeline', None) is not None:
+        conn.info['query_started'] = time.perf_counter()
+
+
+@db.event.listens_for(db.Engine, 'after_cursor_execute')
+def time_after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    timeline = getattr(profile_local, 'timeline', None)
+    if timeline is not None:
+        record_profile_statement(timeline, started, duration, statement, executemany)
+    threshold = app.config['SLOW_QUERY_THRESHOLD_MS']
+    if threshold > 0 and duration * 1000 >= threshold:
+        try:
+            record_slow_query(conn, cursor, statement, parameters, executemany, duration)
+        except Exception as e:
+            logging.error(f"Slow query logging failed: {str(e)}")
+
+
+@app.route("/api/slow_queries", methods=["GET"])
+@token_required
+def get_slow_queries(current_user):
+    if not is_admin(current_user):
+        return jsonify({"error": "Nav tiesību"}), 403
+    sort = request.args.get('sort', 'total')
+    if sort not in SLOW_QUERY_SORTS:
+        return jsonify({"error": "Nederīga kārtošana", "allowed": list(SLOW_QUERY_SORTS)}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), app.config['SLOW_QUERY_MAX_ENTRIES']))
+    except ValueError:
+        return jsonify({"error": "Nederīgs limit"}), 400
+
+    with slow_query_lock:
+        entries = [dict(entry, routes=dict(entry['routes'])) for entry in slow_queries.values()]
+    entries.sort(key=lambda entry: entry[SLOW_QUERY_SORTS[sort]], reverse=True)
+    for entry in entries:
+        entry['avg_ms'] = round(entry['total_ms'] / entry['count'], 3)
+    return jsonify({
+        'threshold_ms': app.config['SLOW_QUERY_THRESHOLD_MS'],
+        'statements': len(entries),
+        'queries': entries[:limit]
+    }), 200
+
+
+@app.route("/api/slow_queries", methods=["DELETE"])
+@token_required
+def reset_slow_queries(current_user):
+    if not is_admin(current_user):
+        return jsonify({"error": "Nav tiesību"}), 403
+    with slow_query_lock:
+        slow_queries.clear()
+    return jsonify({"message": "Lēno vaicājumu žurnāls notīrīts"}), 200
+
+
+# Dzīvības un gatavības pārbaudes ar iesildīšanu pēc starta
+app.config['WARMUP_MODE'] = os.getenv('WARMUP_MODE', 'background')  # background, sync, off
+app.config['WARMUP_POOL_CONNECTIONS'] = int(os.getenv('WARMUP_POOL_CONNECTIONS', 2))
+# Pauze pirms atkārtota mēģinājuma pēc neveiksmes, dubultojas līdz WARMUP_RETRY_MAX_BACKOFF
+app.config['WARMUP_RETRY_BACKOFF'] = float(os.getenv('WARMUP_RETRY_BACKOFF', 5))
+app.config['WARMUP_RETRY_MAX_BACKOFF'] = float(os.getenv('WARMUP_RETRY_MAX_BACKOFF', 300))
+
+warmup_state = {
+    'status': 'pending', 'started_at': None, 'finished_at': None, 'steps': {}, 'error': None,
+    'failures': 0, 'retry_at': None
+}
+warmup_lock = threading.Lock()
+
+
+def warm_pool():
+    engines = [db.engine]
+    if app.config['REPLICA_DATABASE_URL']:
+        engines.append(db.engines['replica'])
+    for engine in engines:
+        # Atveram vairākus savienojumus vienlaicīgi, lai tie paliktu pūlā
+        connections = []
+        try:
+            for _ in range(app.config['WARMUP_POOL_CONNECTIONS']):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(db.text('SELECT 1'))
+        finally:
+            for connection in connections:
+                connection.close()
+
+
+def warm_statements():
+    # Izpildām biežākos vaicājumus, lai to kompilācija nonāktu SQLAlchemy kešā; lasām tikai vienu rindu
+    empty = MultiDict()
+    queries = [
+        list_query('materials', empty),
+        list_query('orders', empty),
+        list_query('workers', empty),
+        shift_totals_query(empty),
+        Material.query.filter(Material.daudzums < Material.reorder_level),
+    ]
+    for query in queries:
+        next(iter(query.yield_per(1)), None)
+    for model in (Employee, Material, Order):
+        db.session.get(model, 0)
+
+
+WARMUP_STEPS = [
+    ('mappers', configure_mappers),
+    ('pool', warm_pool),
+    ('statements', warm_statements),
+    ('search', ensure_search_index),
+    ('fonts', register_report_fonts),
+]
+
+
+def claim_warmup(retry=False):
+    # Vienlaikus ne vairāk kā viena iesildīšana; atkārtojums tikai pēc neveiksmes un pauzes
+    with warmup_lock:
+        if warmup_state['status'] == 'running':
+            return False
+        if retry and (
+            warmup_state['status'] == 'ready'
+            or (warmup_state['retry_at'] is not None and time.monotonic() < warmup_state['retry_at'])
+        ):
+            return False
+        warmup_state.update(status='running', started_at=time.time(), finished_at=None, steps={}, error=None)
+        return True
+
+
+def run_warmup():
+    if claim_warmup():
+        execute_warmup()
+
+
+def execute_warmup():
+    steps = {}
+    try:
+        with app.app_context():
+            try:
+                for name, step in WARMUP_STEPS:
+                    started = time.perf_counter()
+                    step()
+                    steps[name] = round((time.perf_counter() - started) * 1000, 2)
+            finally:
+                db.session.remove()
+        with warmup_lock:
+            warmup_state.update(status='ready', steps=steps, finished_at=time.time(), failures=0, retry_at=None)
+        logging.info(f"Warm-up finished: {steps}")
+    except Exception as e:
+        with warmup_lock:
+            failures = warmup_state['failures'] + 1
+            backoff = min(app.config['WARMUP_RETRY_BACKOFF'] * 2 ** (failures - 1), app.config['WARMUP_RETRY_MAX_BACKOFF'])
+            warmup_state.update(
+                status='failed', steps=steps, error=str(e), finished_at=time.time(),
+                failures=failures, retry_at=time.monotonic() + backoff
+            )
+        logging.error(f"Warm-up failed: {str(e)}")
+
+
+def start_warmup():
+    if app.config['WARMUP_MODE'] == 'off':
+        warmup_state['status'] = 'ready'
+    elif app.config['WARMUP_MODE'] == 'sync':
+        run_warmup()
+    else:
+        threading.Thread(target=run_warmup, name='warmup', daemon=True).start()
+
+
+def restart_warmup_after_fork():
+    # gunicorn --preload: pūla savienojumi un iesildīšanas pavediens palika vecākprocesā
+    global warmup_lock
+    warmup_lock = threading.Lock()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    warmup_state.update(status='pending', started_at=None, finished_at=None, steps={}, error=None, failures=0, retry_at=None)
+    start_warmup()
+
+
+if app.config['FLASK_STARTUP']:
+    os.register_at_fork(after_in_child=restart_warmup_after_fork)
+
+
+@app.route("/api/health/live", methods=["GET"])
+def health_live():
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route("/api/health/ready", methods=["GET"])
+def health_ready():
+    # Piemēram, datubāze startā nebija pieejama; mēģinām vēlreiz fonā
+    if claim_warmup(retry=True):
+        threading.Thread(target=execute_warmup, name='warmup', daemon=True).start()
+    with warmup_lock:
+        status, error = warmup_state['status'], warmup_state['error']
+    if status != 'ready':
+        return jsonify({"status": status, "error": error}), 503
+
+    try:
+        db.session.execute(db.text('SELECT 1'))
+    except Exception as e:
+        logging.warning(f"Readiness check failed: {str(e)}")
+        return jsonify({"status": "unavailable", "database": "error", "details": str(e)}), 503
+    finally:
+        db.session.remove()
+
+    return jsonify({
+        "status": "ready",
+        "database": "ok",
+        "warmup": warmup_state['steps']
+    }), 200
+
+
+# Pūla bērnprocesiem (PDF zīmēšana) iesildīšana nav vajadzīga
+if app.config['FLASK_STARTUP'] and multiprocessing.parent_process() is None:
+    start_warmup()
+
 if __name__ == "__main__":
     app.run(debug=True)
 
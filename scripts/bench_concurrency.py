@@ -0,0 +1,67 @@
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Salīdzina WSGI (api.index:app) un ASGI (api.asgi:app) caurlaidību pie vienlaicīgiem pieprasījumiem.
+#
+#   gunicorn -w 1 -b 127.0.0.1:8001 api.index:app
+#   uvicorn --workers 1 --port 8002 api.asgi:app
+#   python scripts/bench_concurrency.py --token <JWT> http://127.0.0.1:8001 http://127.0.0.1:8002
+
+
+def run(base_url, path, token, concurrency, total):
+    local = threading.local()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def one(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        response = session.get(base_url + path, headers=headers)
+        return time.perf_counter() - started, response.status_code
+
+    # Iesildīšana
+    for _ in range(concurrency):
+        one(None)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        'rps': total / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('urls', nargs='+')
+    arg_parser.add_argument('--token', required=True)
+    arg_parser.add_argument('--path', action='append')
+    arg_parser.add_argument('-c', '--concurrency', type=int, default=32)
+    arg_parser.add_argument('-n', '--requests', type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    for path in args.path or ['/materials', '/api/stats/materials']:
+        for url in args.urls:
+            result = run(url, path, args.token, args.concurrency, args.requests)
+            print(
+                f"{url}{path}: {result['rps']:.1f} req/s, "
+                f"p50 {result['p50']:.1f} ms, p95 {result['p95']:.1f} ms, "
+                f"errors {result['errors']}"
+            )
+
+
+if __name__ == '__main__':
+    main()
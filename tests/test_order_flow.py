@@ -0,0 +1,172 @@
+import datetime
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('WARMUP_MODE', 'off')
+os.environ.setdefault('ADMISSION_ENABLED', '0')
+
+from api import index  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    with index.app.app_context():
+        index.db.drop_all()
+        index.db.create_all()
+        employee = index.Employee(vards='Jānis', uzvards='Bērziņš', amats='Administrators', kods=1234, status='active')
+        index.db.session.add(employee)
+        index.db.session.commit()
+        headers = {'Authorization': 'Bearer ' + index.generate_token(employee.id)}
+        employee_id = employee.id
+    yield index.app.test_client(), headers, employee_id
+    with index.app.app_context():
+        index.db.session.remove()
+
+
+def create_order(client, headers, employee_id, quantity=2):
+    material = client.post('/materials', headers=headers, json={
+        'nosaukums': 'Skrūve', 'daudzums': 10, 'noliktava': 'A', 'vieta': 'P1', 'vieniba': 'gab'
+    }).get_json()['material']
+    response = client.post('/orders', headers=headers, json={
+        'nosaukums': 'Pasūtījums',
+        'daudzums': 1,
+        'employee_id': employee_id,
+        'materials': [{'id': material['id'], 'version': material['version'], 'quantity': quantity}]
+    })
+    assert response.status_code == 201
+    return response.get_json()['order_id'], material['id']
+
+
+def test_created_order_can_be_accepted_and_finished(client):
+    client, headers, employee_id = client
+    order_id, material_id = create_order(client, headers, employee_id)
+
+    response = client.patch(f'/orders/{order_id}/accept', headers=headers)
+    assert response.status_code == 200, response.get_json()
+    response = client.patch(f'/orders/{order_id}/finish', headers=headers)
+    assert response.status_code == 200, response.get_json()
+
+    consumption = client.get(f'/api/consumption?material_id={material_id}&bucket=hour', headers=headers).get_json()
+    assert sum(row['quantity'] for row in consumption['rows']) == 2
+
+
+def test_created_order_can_be_accepted_in_batch(client):
+    client, headers, employee_id = client
+    order_id, _ = create_order(client, headers, employee_id)
+
+    response = client.patch('/orders/batch/accept', headers=headers, json={'order_ids': [order_id]})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['applied'] == 1
+
+    response = client.patch('/orders/batch/finish', headers=headers, json={'order_ids': [order_id]})
+    assert response.get_json()['applied'] == 1
+
+
+def test_deleted_and_updated_orders_adjust_consumption(client):
+    client, headers, employee_id = client
+    order_id, material_id = create_order(client, headers, employee_id, quantity=3)
+    client.patch(f'/orders/{order_id}/accept', headers=headers)
+
+    def consumed():
+        rows = client.get(f'/api/consumption?material_id={material_id}&bucket=day', headers=headers).get_json()['rows']
+        return sum(row['quantity'] for row in rows)
+
+    version = client.get(f'/materials/{material_id}', headers=headers).get_json()['version']
+    response = client.put(f'/orders/{order_id}', headers=headers, json={
+        'materials': [{'id': material_id, 'version': version, 'quantity': 1}]
+    })
+    assert response.status_code == 200, response.get_json()
+    assert consumed() == 1
+    client.post('/api/consumption/rebuild', headers=headers)
+    assert consumed() == 1
+
+    response = client.delete(f'/orders/{order_id}', headers=headers)
+    assert response.status_code == 200, response.get_json()
+    assert consumed() == 0
+
+    client.post('/api/consumption/rebuild', headers=headers)
+    assert consumed() == 0
+
+
+@pytest.mark.parametrize('snapshot_interval', [0, 86400])
+def test_stock_as_of_replays_the_ledger(client, monkeypatch, snapshot_interval):
+    client, headers, employee_id = client
+    monkeypatch.setitem(index.app.config, 'STOCK_SNAPSHOT_INTERVAL', snapshot_interval)
+    monkeypatch.setitem(index.stock_snapshot_due, 'at', None)
+    with index.app.app_context():
+        # Materiāls no laika pirms krājumu žurnāla, bez sākuma kustības
+        material = index.Material(nosaukums='Skava', noliktava='A', vieta='P2', vieniba='gab', daudzums=100, version=1)
+        index.db.session.add(material)
+        index.db.session.commit()
+        material_id = material.id
+
+    before = datetime.datetime.utcnow().isoformat()
+    response = client.post('/orders', headers=headers, json={
+        'nosaukums': 'Pasūtījums',
+        'daudzums': 1,
+        'employee_id': employee_id,
+        'materials': [{'id': material_id, 'version': 1, 'quantity': 3}]
+    })
+    assert response.status_code == 201
+    after = datetime.datetime.utcnow().isoformat()
+
+    def stock_as_of(date):
+        response = client.get(f'/api/stock/as_of?date={date}&material_id={material_id}', headers=headers)
+        return response.get_json()['materials'][0]['daudzums']
+
+    with index.app.app_context():
+        assert (index.StockSnapshot.query.count() > 0) == bool(snapshot_interval)
+    assert stock_as_of(before) == 100
+    assert stock_as_of(after) == 97
+
+    client.post('/api/stock/snapshots', headers=headers)
+    assert stock_as_of(before) == 100
+    assert stock_as_of(after) == 97
+
+
+@pytest.mark.parametrize('order_ids', [['abc'], [None], [1.5], [True]])
+def test_batch_transition_rejects_invalid_order_ids(client, order_ids):
+    client, headers, _ = client
+    response = client.patch('/orders/batch/accept', headers=headers, json={'order_ids': order_ids})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Nederīgs pasūtījuma ID'
+
+
+def test_admission_rejects_with_retry_after(client, monkeypatch):
+    client, headers, _ = client
+    monkeypatch.setitem(index.app.config, 'ADMISSION_ENABLED', True)
+    monkeypatch.setattr(index, 'local_limiter', index.LocalLimiter())
+    monkeypatch.setitem(index.ADMISSION_CLASSES, 'report', {'concurrency': 1, 'rate': 0.1, 'burst': 1, 'retry_after': 3})
+
+    assert client.post('/api/consumption/rebuild', headers=headers).status_code == 201
+    response = client.post('/api/consumption/rebuild', headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+    monkeypatch.setattr(index, 'local_limiter', index.LocalLimiter())
+    monkeypatch.setitem(index.ADMISSION_CLASSES, 'report', {'concurrency': 0, 'rate': 1, 'burst': 1, 'retry_after': 3})
+    response = client.post('/api/consumption/rebuild', headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    # Sarakstu ierobežojumi neskar
+    assert client.get('/orders', headers=headers).status_code == 200
+
+
+def test_batch_runs_sub_requests_as_the_caller(client):
+    client, headers, employee_id = client
+    assert client.post('/batch', json={'requests': [{'method': 'GET', 'path': '/materials'}]}).status_code == 403
+
+    order_id, _ = create_order(client, headers, employee_id)
+    response = client.post('/batch', headers=headers, json={'requests': [
+        {'id': 'list', 'method': 'GET', 'path': '/materials', 'headers': {'Authorization': 'Bearer invalid'}},
+        {'id': 'missing', 'method': 'GET', 'path': '/orders/999999'},
+        {'id': 'accept', 'method': 'PATCH', 'path': f'/orders/{order_id}/accept'},
+        {'id': 'invalid', 'method': 'POST', 'path': '/materials', 'body': {'nosaukums': 'Bez daudzuma'}},
+    ]})
+    assert response.status_code == 200
+    statuses = {item['id']: item['status'] for item in response.get_json()['responses']}
+    assert statuses == {'list': 200, 'missing': 404, 'accept': 200, 'invalid': 400}
+    assert client.get(f'/orders/{order_id}', headers=headers).get_json()['status'] == 'accepted'